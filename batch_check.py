@@ -0,0 +1,77 @@
+import sys
+
+import numpy as np
+
+from make_suudoku import FROM_ASCII
+from puzzle_bank import HEADER, board_size, read_header, record_size
+
+CHAR_VALUES = np.frombuffer(FROM_ASCII, dtype=np.uint8)  # 文字 → セルの値
+
+
+def as_cells(boards, box=3):
+    # (N, 81) でも (N, 9, 9) でも受け取り、(N, 81) の uint8 配列にする（box が 4 なら (N, 256)）
+    return np.asarray(boards, dtype=np.uint8).reshape(-1, box**4)
+
+
+def valid_solutions(solutions, box=3):
+    # 各行・列・ボックスが 1〜size の並べ替えになっている盤面を True にする。
+    # 数字 v を 1 << (v - 1) に変換して OR を取り、size ビットすべてが立つかで判定する（0 や範囲外は不一致になる）
+    size = box * box
+    full_mask = (1 << size) - 1
+    grid = as_cells(solutions, box)
+    bits = (np.left_shift(1, grid.astype(np.uint32)) >> 1).reshape(-1, size, size)
+    boxes = bits.reshape(-1, box, box, box, box).transpose(0, 1, 3, 2, 4).reshape(-1, size, size)
+    ok = (np.bitwise_or.reduce(bits, axis=2) == full_mask).all(axis=1)
+    ok &= (np.bitwise_or.reduce(bits, axis=1) == full_mask).all(axis=1)
+    ok &= (np.bitwise_or.reduce(boxes, axis=2) == full_mask).all(axis=1)
+    return ok
+
+
+def clues_match(puzzles, solutions, box=3):
+    # 問題の手がかりがすべて解答と一致している盤面を True にする
+    puzzles, solutions = as_cells(puzzles, box), as_cells(solutions, box)
+    return ((puzzles == 0) | (puzzles == solutions)).all(axis=1)
+
+
+def check_boards(puzzles, solutions, box=3):
+    return valid_solutions(solutions, box) & clues_match(puzzles, solutions, box)
+
+
+def load_bank_arrays(path):
+    # 問題集ファイルを (問題, 解答) の (N, セル数) 配列として memmap で読む
+    with open(path, "rb") as f:
+        packed, box = read_header(f)[:2]
+    size = record_size(packed, box)
+    raw = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER.size)
+    records = raw[: len(raw) // size * size].reshape(-1, size)
+    return records, packed, box
+
+
+def decode_records(records, packed, box=3):
+    cells_per_board = box**4
+    if packed:
+        cells = np.empty((len(records), records.shape[1] * 2), dtype=np.uint8)
+        cells[:, 0::2] = records >> 4
+        cells[:, 1::2] = records & 15
+        size = board_size(packed, box) * 2
+        return cells[:, :cells_per_board], cells[:, size : size + cells_per_board]
+    cells = CHAR_VALUES[records]
+    return cells[:, :cells_per_board], cells[:, cells_per_board:]
+
+
+def audit_bank(path, chunk_size=100000):
+    # 問題集全体をチャンクごとに検査し、不正な問題の番号を返す
+    records, packed, box = load_bank_arrays(path)
+    bad = []
+    for start in range(0, len(records), chunk_size):
+        puzzles, solutions = decode_records(np.asarray(records[start : start + chunk_size]), packed, box)
+        bad.extend((np.flatnonzero(~check_boards(puzzles, solutions, box)) + start).tolist())
+    return len(records), bad
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        count, bad = audit_bank(path)
+        print(f"{path}: {count} puzzles, {len(bad)} invalid")
+        for i in bad[:20]:
+            print(f"  #{i}")
@@ -0,0 +1,248 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import time
+
+from difficulty import rate
+from make_suudoku import (
+    DEFAULT_CLUES,
+    REMOVAL_BACKENDS,
+    SOLVER_BACKENDS,
+    SPECULATIVE_BATCH,
+    Board,
+    generate_full_sudoku,
+    has_unique_solution,
+    remove_numbers_from_board,
+    remove_numbers_parallel,
+    remove_numbers_to_target,
+    solve,
+)
+
+# 難しいことで知られる問題（17ヒントの問題や AI Escargot など）。すべて解が一意
+HARD_PUZZLES = [
+    "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+    "800000000003600000070090200050007000000045700000100030001000068008500010090000400",
+    "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+    "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+    "000000012008030000000000040120500000000004700060000000507000300000620000000100000",
+    "100007090030020008009600500005300900010080002600004000300000010040000007007000300",
+    "000000039000001005003050800008090006070002000100400000009080050020000600400700000",
+    "120400300300010050006000100700090000040603000003002000500080700007000005000000098",
+    "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+    "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+]
+
+
+def make_corpus(seed, count):
+    # シードを固定して生成した問題に、難問を加えたもの
+    random.seed(seed)
+    corpus = [Board.from_string(text) for text in HARD_PUZZLES]
+    for _ in range(count):
+        corpus.append(remove_numbers_to_target(generate_full_sudoku(), (22, 30))[0])
+    return corpus
+
+
+def make_cases(seed, repeat, backends=SOLVER_BACKENDS, pool=None):
+    corpus = make_corpus(seed, repeat)
+    random.seed(seed)
+    full_boards = [generate_full_sudoku() for _ in range(repeat)]
+    # (名前, 関数, 呼び出しごとの引数のリストを作る関数)。ソルバーごとに同じ入力で比べる
+    cases = [
+        (
+            "remove_numbers_from_board",
+            remove_numbers_from_board,
+            lambda: [(board.copy(),) for board in full_boards],
+        ),
+        ("rate", rate, lambda: [(board,) for board in corpus]),
+    ]
+    for backend in backends:
+        cases += [
+            (
+                f"generate_full_sudoku[{backend}]",
+                generate_full_sudoku,
+                lambda b=backend: [(b,) for _ in range(repeat)],
+            ),
+            (
+                f"has_unique_solution[{backend}]",
+                has_unique_solution,
+                lambda b=backend: [(board, b) for board in corpus],
+            ),
+            (f"solve[{backend}]", solve, lambda b=backend: [(board.copy(), b) for board in corpus]),
+        ]
+        if backend not in REMOVAL_BACKENDS:
+            continue  # 穴あけに使えないソルバー
+        cases.append(
+            (
+                f"remove_numbers_to_target[{backend}]",
+                remove_numbers_to_target,
+                lambda b=backend: [(board.copy(), (22, 30), b) for board in full_boards],
+            )
+        )
+        if pool is not None:
+            cases.append(
+                (
+                    f"remove_numbers_parallel[{backend}]",
+                    remove_numbers_parallel,
+                    lambda b=backend: [(board.copy(), pool, (22, 30), SPECULATIVE_BATCH, b) for board in full_boards],
+                )
+            )
+    return cases
+
+
+# 16×16 以上は1回の処理が長いので、実行回数を repeat のこの数分の1にする
+REPEAT_DIVISOR = {3: 1, 4: 10, 5: 50}
+
+
+def make_size_cases(seed, repeat, box, backends=SOLVER_BACKENDS, pool=None):
+    # 16×16（box=4）や 25×25（box=5）の盤面で、生成・穴あけ・一意性判定・求解を測る
+    size = box * box
+    repeat = max(1, repeat // REPEAT_DIVISOR[box])
+    random.seed(seed)
+    full_boards = [generate_full_sudoku(box=box) for _ in range(repeat)]
+    puzzles = [remove_numbers_to_target(board.copy())[0] for board in full_boards]
+    cases = []
+    for backend in backends:
+        tag = f"[{backend},{size}x{size}]"
+        cases += [
+            (
+                f"generate_full_sudoku{tag}",
+                generate_full_sudoku,
+                lambda b=backend: [(b, box) for _ in range(repeat)],
+            ),
+            (
+                f"has_unique_solution{tag}",
+                has_unique_solution,
+                lambda b=backend: [(board, b) for board in puzzles],
+            ),
+            (f"solve{tag}", solve, lambda b=backend: [(board.copy(), b) for board in puzzles]),
+        ]
+        if backend not in REMOVAL_BACKENDS:
+            continue
+        cases.append(
+            (
+                f"remove_numbers_to_target{tag}",
+                remove_numbers_to_target,
+                lambda b=backend: [(board.copy(), DEFAULT_CLUES[box], b) for board in full_boards],
+            )
+        )
+        if pool is not None:
+            cases.append(
+                (
+                    f"remove_numbers_parallel{tag}",
+                    remove_numbers_parallel,
+                    lambda b=backend: [
+                        (board.copy(), pool, DEFAULT_CLUES[box], SPECULATIVE_BATCH, b) for board in full_boards
+                    ],
+                )
+            )
+    return cases
+
+
+def percentile(times, p):
+    return times[min(len(times) - 1, int(len(times) * p / 100))]
+
+
+def run_case(func, calls):
+    times = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    total = sum(times)
+    return {
+        "runs": len(times),
+        "p50_ms": percentile(times, 50) * 1000,
+        "p95_ms": percentile(times, 95) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "mean_ms": total / len(times) * 1000,
+        "per_second": len(times) / total if total else 0.0,
+    }
+
+
+def run_benchmarks(seed=0, repeat=200, only=None, backends=SOLVER_BACKENDS, boxes=(3,), workers=None):
+    # workers を指定すると、プロセスプールを使う remove_numbers_parallel も測る
+    pool = multiprocessing.Pool(workers) if workers else None
+    results = {}
+    cases = make_cases(seed, repeat, backends, pool) if 3 in boxes else []
+    for box in boxes:
+        if box != 3:
+            cases += make_size_cases(seed, repeat, box, backends, pool)
+    for name, func, make_calls in cases:
+        if only and name.split("[")[0] not in only and name not in only:
+            continue
+        calls = make_calls()
+        random.seed(seed)  # 関数内の乱数も毎回同じ列にする
+        results[name] = run_case(func, calls)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    # p50 か p95 が基準より tolerance の割合以上遅くなったものを返す
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]:.3f} -> {result[key]:.3f} ms")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<44}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per sec':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<44}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+            f"{result['p99_ms']:>10.3f}{result['per_second']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数独の生成・一意性判定・ソルバーのベンチマーク")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=200, help="1項目あたりの実行回数")
+    parser.add_argument("--only", nargs="*", help="実行する項目の名前（solve や solve[dlx]）")
+    parser.add_argument(
+        "--backends", nargs="*", default=SOLVER_BACKENDS, choices=SOLVER_BACKENDS, help="比べるソルバー"
+    )
+    parser.add_argument(
+        "--boxes", nargs="*", type=int, default=[3], choices=(3, 4, 5), help="測る盤面のボックスの大きさ（4 は 16×16）"
+    )
+    parser.add_argument("--workers", type=int, help="remove_numbers_parallel を測るときのプロセス数")
+    parser.add_argument("--out", help="結果を JSON で保存するファイル")
+    parser.add_argument("--baseline", help="比較対象の JSON（遅くなった項目があれば終了コード 1）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する遅れの割合")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.seed, args.repeat, args.only, args.backends, args.boxes, args.workers)
+    print_results(results)
+
+    if args.out:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "boxes": args.boxes,
+            "workers": args.workers,
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,364 @@
+import itertools
+import sys
+
+from make_suudoku import geometry
+
+# 人が使うテクニックを簡単な順に並べたもの。問題の難易度は、解くのに必要だった一番難しいテクニックの番号
+LEVEL_NAMES = (
+    "hidden_single",
+    "naked_single",
+    "pointing",
+    "claiming",
+    "naked_pair",
+    "hidden_pair",
+    "naked_triple",
+    "x_wing",
+    "swordfish",
+    "guess",  # どのテクニックでも進まない（仮置きが必要）
+)
+GUESS = len(LEVEL_NAMES) - 1
+
+# 配信で使う難易度の区分（LEVEL_NAMES の番号の範囲）
+TIERS = {
+    "easy": (0, 1),
+    "medium": (2, 3),
+    "hard": (4, 6),
+    "expert": (7, 8),
+    "extreme": (9, 9),
+}
+
+def rate(board):
+    # (難易度の番号, テクニック名) を返す
+    level = LogicalSolver(board).solve()
+    return level, LEVEL_NAMES[level]
+
+
+_masks = {}
+
+
+def board_masks(geo):
+    # 盤面の大きさごとの表。セル i をビット i で表すビットマスクを使う。
+    # 転置した盤面（セル (r, c) をビット c * size + r）も持つので、列も連続したビットとして取り出せる
+    if geo.box not in _masks:
+        size = geo.size
+        transpose = [geo.cell_col[i] * size + geo.cell_row[i] for i in range(geo.area)]
+        _masks[geo.box] = (
+            [sum(1 << i for i in unit) for unit in geo.units],  # ユニットごとのセル
+            [sum(1 << p for p in peers) for peers in geo.peers],  # セルごとのピア
+            transpose,
+            [sum(1 << transpose[p] for p in peers) for peers in geo.peers],  # 転置した盤面でのピア
+        )
+    return _masks[geo.box]
+
+
+def cells_of(mask):
+    # ビットマスクが表すセル番号の一覧
+    result = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        result.append(bit.bit_length() - 1)
+    return result
+
+
+def fish_groups(lines, count, start=0, crossed=0, chosen=0, depth=0):
+    # lines（(行番号, 候補の列のマスク) の一覧）から count 本を選び、候補の列がちょうど count 本に収まる組の
+    # (列のマスク, 行のマスク) を itertools.combinations と同じ順に返す。途中で count 本を超えた組はその先を調べない
+    for k in range(start, len(lines)):
+        n, mask = lines[k]
+        union = crossed | mask
+        if union.bit_count() > count:
+            continue
+        if depth + 1 == count:
+            if union.bit_count() == count:
+                yield union, chosen | 1 << n
+        else:
+            yield from fish_groups(lines, count, k + 1, union, chosen | 1 << n, depth + 1)
+
+
+class LogicalSolver:
+    # 盤面の大きさごとの表（geometry）を使うので、16×16 や 25×25 も同じ手順で採点できる。
+    # 候補はセルごとのビットマスク（cand）のほかに、数字ごとに「その数字が入りうるセル」のビットマスクでも持つ。
+    # spots[d] は行ごと、columns[d] は列ごとにビットが並んでいて、候補を消すたびに3つとも更新する。
+    # 各テクニックは AND やシフトでユニット内の位置を取り出すだけなので、セルを数字ごとに数え直さずに済む。
+    # また数字ごとに候補が変わった回数（versions）を数え、1つの数字だけを見るテクニックは
+    # 前回調べたときから候補が変わっていない数字を飛ばす
+    __slots__ = (
+        "cells",
+        "cand",
+        "left",
+        "geo",
+        "size",
+        "spots",
+        "columns",
+        "unit_masks",
+        "peer_masks",
+        "transpose",
+        "column_peer_masks",
+        "versions",
+        "seen",
+    )
+
+    def __init__(self, board):
+        geo = self.geo = geometry(board.box_size)
+        size = self.size = geo.size
+        self.unit_masks, self.peer_masks, self.transpose, self.column_peer_masks = board_masks(geo)
+        self.cells = list(board.cells)
+        self.spots = [0] * size
+        self.columns = [0] * size
+        self.versions = [0] * size
+        self.seen = {}  # テクニックの名前 -> 前回調べたときの versions
+        self.left = self.cells.count(0)
+        # 数字 d が入りうるのは、空きセルのうち d を置いたセルのピアでないもの
+        peer_masks, column_peer_masks, transpose = self.peer_masks, self.column_peer_masks, self.transpose
+        cell_row, cell_col, cell_box = geo.cell_row, geo.cell_col, geo.cell_box
+        blocked = [0] * size
+        column_blocked = [0] * size
+        filled = column_filled = 0
+        # セルの候補は、行・列・ボックスごとに使われている数字をまとめてから引く
+        row_used = [0] * size
+        col_used = [0] * size
+        box_used = [0] * size
+        for i, num in enumerate(self.cells):
+            if num:
+                blocked[num - 1] |= peer_masks[i]
+                column_blocked[num - 1] |= column_peer_masks[i]
+                filled |= 1 << i
+                column_filled |= 1 << transpose[i]
+                bit = 1 << (num - 1)
+                row_used[cell_row[i]] |= bit
+                col_used[cell_col[i]] |= bit
+                box_used[cell_box[i]] |= bit
+        full = (1 << geo.area) - 1
+        for d in range(size):
+            self.spots[d] = full & ~(filled | blocked[d])
+            self.columns[d] = full & ~(column_filled | column_blocked[d])
+        all_digits = geo.all_digits
+        self.cand = [
+            0 if num else all_digits & ~(row_used[cell_row[i]] | col_used[cell_col[i]] | box_used[cell_box[i]])
+            for i, num in enumerate(self.cells)
+        ]
+
+    def remove(self, i, mask):
+        # セル i の候補から mask の数字を消す。消えたものがあれば True
+        removed = self.cand[i] & mask
+        if not removed:
+            return False
+        self.cand[i] ^= removed
+        spots, columns, versions = self.spots, self.columns, self.versions
+        cell = ~(1 << i)
+        column_cell = ~(1 << self.transpose[i])
+        while removed:
+            bit = removed & -removed
+            removed ^= bit
+            d = bit.bit_length() - 1
+            spots[d] &= cell
+            columns[d] &= column_cell
+            versions[d] += 1
+        return True
+
+    def place(self, i, num):
+        cand, spots = self.cand, self.spots
+        d = num - 1
+        self.remove(i, cand[i])
+        self.cells[i] = num
+        # num の候補を消すのは、ピアのうち spots[d] にまだ残っているセルだけでよい
+        peers = spots[d] & self.peer_masks[i]
+        spots[d] ^= peers
+        self.columns[d] &= ~self.column_peer_masks[i]
+        self.versions[d] += 1
+        bit = ~(1 << d)
+        while peers:
+            low = peers & -peers
+            peers ^= low
+            cand[low.bit_length() - 1] &= bit
+        self.left -= 1
+
+    def solve(self):
+        # 簡単なテクニックから順に試し、進んだら最初に戻る
+        steps = (
+            self.hidden_singles,
+            self.naked_singles,
+            self.pointing,
+            self.claiming,
+            self.naked_pairs,
+            self.hidden_pairs,
+            self.naked_triples,
+            self.x_wings,
+            self.swordfish,
+        )
+        hardest = 0
+        while self.left:
+            for level, step in enumerate(steps):
+                if step():
+                    hardest = max(hardest, level)
+                    break
+            else:
+                return GUESS
+        return hardest
+
+    def changed_digits(self, name):
+        # テクニック name で前回調べてから候補が変わった数字。調べる前の版を覚えておくので、
+        # 調べている間に候補が変わった数字は次の呼び出しでもう一度調べる
+        versions = self.versions
+        seen = self.seen.setdefault(name, [-1] * self.size)
+        digits = [d for d in range(self.size) if versions[d] != seen[d]]
+        for d in digits:
+            seen[d] = versions[d]
+        return digits
+
+    def hidden_singles(self):
+        spots, unit_masks = self.spots, self.unit_masks
+        found = False
+        for d in self.changed_digits("hidden_singles"):
+            digit = spots[d]
+            if not digit:
+                continue  # この数字はすべて置き終わった
+            for unit_mask in unit_masks:
+                mask = digit & unit_mask
+                if mask and not mask & (mask - 1):
+                    self.place(mask.bit_length() - 1, d + 1)
+                    found = True
+                    digit = spots[d]
+                    if not digit:
+                        break
+        return found
+
+    def naked_singles(self):
+        cand = self.cand
+        found = False
+        for i in range(self.geo.area):
+            mask = cand[i]
+            if mask and not mask & (mask - 1):
+                self.place(i, mask.bit_length())
+                found = True
+        return found
+
+    def eliminate(self, cells, mask):
+        found = False
+        for i in cells:
+            if self.remove(i, mask):
+                found = True
+        return found
+
+    def pointing(self):
+        # ボックス内で数字の候補が1行（1列）に収まっていれば、その行（列）の他のボックスから消す
+        geo, size, spots = self.geo, self.size, self.spots
+        rows, cols, boxes = self.unit_masks[:size], self.unit_masks[size : 2 * size], self.unit_masks[2 * size :]
+        found = False
+        for d in self.changed_digits("pointing"):
+            for box in boxes:
+                mask = spots[d] & box
+                if not mask & (mask - 1):
+                    continue  # 候補が2か所未満
+                first = (mask & -mask).bit_length() - 1
+                for line in (rows[geo.cell_row[first]], cols[geo.cell_col[first]]):
+                    if not mask & ~line:
+                        others = spots[d] & line & ~box
+                        if others:
+                            found |= self.eliminate(cells_of(others), 1 << d)
+        return found
+
+    def claiming(self):
+        # 行（列）で数字の候補が1つのボックスに収まっていれば、そのボックスの他のセルから消す
+        cell_box, size, spots = self.geo.cell_box, self.size, self.spots
+        boxes = self.unit_masks[2 * size :]
+        found = False
+        for d in self.changed_digits("claiming"):
+            for line in self.unit_masks[: 2 * size]:
+                mask = spots[d] & line
+                if not mask & (mask - 1):
+                    continue
+                box = boxes[cell_box[(mask & -mask).bit_length() - 1]]
+                if not mask & ~box:
+                    others = spots[d] & box & ~line
+                    if others:
+                        found |= self.eliminate(cells_of(others), 1 << d)
+        return found
+
+    def naked_pairs(self):
+        cand = self.cand
+        found = False
+        for unit in self.geo.units:
+            pairs = {}
+            for i in unit:
+                mask = cand[i]
+                if mask and mask.bit_count() == 2:
+                    if mask in pairs:
+                        others = [j for j in unit if j != i and j != pairs[mask]]
+                        found |= self.eliminate(others, mask)
+                    pairs[mask] = i
+        return found
+
+    def hidden_pairs(self):
+        # 2つの数字が同じ2セルにしか入らなければ、その2セルから他の候補を消す
+        spots, cand = self.spots, self.cand
+        found = False
+        for unit_mask in self.unit_masks:
+            places = {}
+            for d, digit in enumerate(spots):
+                mask = digit & unit_mask
+                if mask.bit_count() != 2:
+                    continue
+                bit = 1 << d
+                if mask in places:
+                    keep = bit | places[mask]
+                    for i in cells_of(mask):
+                        found |= self.remove(i, cand[i] & ~keep)
+                places[mask] = bit
+        return found
+
+    def naked_triples(self):
+        cand = self.cand
+        found = False
+        for unit in self.geo.units:
+            small = [i for i in unit if cand[i] and cand[i].bit_count() <= 3]
+            for trio in itertools.combinations(small, 3):
+                mask = cand[trio[0]] | cand[trio[1]] | cand[trio[2]]
+                if mask.bit_count() == 3:
+                    found |= self.eliminate([i for i in unit if i not in trio], mask)
+        return found
+
+    def fish(self, count):
+        # count 本の行（列）で数字の候補が同じ count 本の列（行）に収まれば、その列（行）の他の行から消す。
+        # 行 n の候補の列は spots[d] の n 番目の size ビット、列 n の候補の行は columns[d] の n 番目の size ビット
+        size = self.size
+        full = (1 << size) - 1
+        found = False
+        for d in self.changed_digits(f"fish{count}"):
+            for lines, crosses, is_row in ((self.spots, self.columns, True), (self.columns, self.spots, False)):
+                digit = lines[d]
+                spots = []
+                for n in range(size):
+                    mask = digit >> (n * size) & full
+                    if 2 <= mask.bit_count() <= count:
+                        spots.append((n, mask))
+                for crossed, chosen in fish_groups(spots, count):
+                    for cross in cells_of(crossed):
+                        others = crosses[d] >> (cross * size) & full & ~chosen
+                        if others:
+                            if is_row:
+                                cells = [n * size + cross for n in cells_of(others)]
+                            else:
+                                cells = [cross * size + n for n in cells_of(others)]
+                            found |= self.eliminate(cells, 1 << d)
+        return found
+
+    def x_wings(self):
+        return self.fish(2)
+
+    def swordfish(self):
+        return self.fish(3)
+
+
+if __name__ == "__main__":
+    # 問題集ファイルを採点して難易度の索引を作り、分布を表示する
+    from puzzle_bank import PuzzleBank, write_index
+
+    for path in sys.argv[1:]:
+        write_index(path, "level")
+        bank = PuzzleBank(path, key="level")
+        print(f"{path}: {len(bank)} puzzles")
+        for level, (_, count) in sorted(bank.tiers.items()):
+            print(f"  {level} {LEVEL_NAMES[level]:<14}{count:>10}")
+        bank.close()
@@ -0,0 +1,158 @@
+from make_suudoku import geometry
+
+# 数独を完全被覆問題として解く Dancing Links（Algorithm X）。
+# 列は「セルが埋まる」「行に数字 d がある」「列に数字 d がある」「ボックスに数字 d がある」の 4 × セル数 個、
+# 行は「セル i に数字 d を置く」の セル数 × size 個（9×9 なら 729 個）で、各行はちょうど 4 つの列にノードを持つ
+
+
+def row_columns(r, geo):
+    size, area = geo.size, geo.area
+    i, d = divmod(r, size)
+    return (
+        1 + i,
+        1 + area + geo.cell_row[i] * size + d,
+        1 + 2 * area + geo.cell_col[i] * size + d,
+        1 + 3 * area + geo.cell_box[i] * size + d,
+    )
+
+
+class DancingLinksSolver:
+    # BitmaskSolver と同じ load / search / write_to を持つ。
+    # リンク構造は最初に1度だけ作り、load のたびに前回の被覆を逆順に戻して使い回す
+    __slots__ = ("L", "R", "U", "D", "C", "S", "trail", "chosen", "board", "rng", "nodes", "box", "size", "first")
+
+    def __init__(self, rng=None, box=3):
+        geo = geometry(box)
+        columns = 4 * geo.area
+        rows = geo.area * geo.size
+        self.box = box
+        self.size = geo.size
+        self.first = columns + 1  # 最初の行のノード番号（0 は根、1〜columns は列の見出し）
+        nodes = self.first + 4 * rows
+        self.L = list(range(nodes))
+        self.R = list(range(nodes))
+        self.U = list(range(nodes))
+        self.D = list(range(nodes))
+        self.C = list(range(nodes))
+        self.S = [0] * (columns + 1)
+        for c in range(columns + 1):
+            self.L[c] = c - 1 if c else columns
+            self.R[c] = c + 1 if c < columns else 0
+        for r in range(rows):
+            first = self.first + 4 * r
+            for k, c in enumerate(row_columns(r, geo)):
+                node = first + k
+                self.L[node] = first + (k - 1) % 4
+                self.R[node] = first + (k + 1) % 4
+                self.C[node] = c
+                self.U[node] = self.U[c]
+                self.D[node] = c
+                self.D[self.U[c]] = node
+                self.U[c] = node
+                self.S[c] += 1
+        self.trail = []  # 被覆した列の履歴
+        self.chosen = []  # 選んだ行（初期配置も含む）
+        self.board = None
+        self.rng = rng  # None なら行を決まった順に試す
+        self.nodes = 0
+
+    def cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[c]] = L[c]
+        R[L[c]] = R[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+        self.trail.append(c)
+
+    def uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        L[R[c]] = c
+        R[L[c]] = c
+
+    def undo(self, mark, chosen_mark):
+        trail = self.trail
+        while len(trail) > mark:
+            self.uncover(trail.pop())
+        del self.chosen[chosen_mark:]
+
+    def load(self, board):
+        if board.box_size != self.box:
+            raise ValueError(f"solver is for box size {self.box}, board has {board.box_size}")
+        self.undo(0, 0)
+        self.board = board.copy()
+        self.nodes = 0
+        L, R, C, size = self.L, self.R, self.C, self.size
+        for i, num in enumerate(board.cells):
+            if num:
+                if num > size:
+                    return False
+                first = self.first + 4 * (i * size + num - 1)
+                for node in range(first, first + 4):
+                    if L[R[C[node]]] != C[node]:
+                        return False  # 同じ列がすでに被覆されている＝初期配置が矛盾している
+                for node in range(first, first + 4):
+                    self.cover(C[node])
+                self.chosen.append(i * size + num - 1)
+        return True
+
+    def search(self, limit=1):
+        # 見つけた解の数を返す。limit に達した場合は最後の解を chosen に残す
+        self.nodes += 1
+        R, D, S, C = self.R, self.D, self.S, self.C
+        c = R[0]
+        if c == 0:
+            return 1
+        best, size = c, S[c]
+        c = R[c]
+        while c and size > 1:
+            if S[c] < size:
+                best, size = c, S[c]
+            c = R[c]
+        if not size:
+            return 0
+        rows = []
+        node = D[best]
+        while node != best:
+            rows.append(node)
+            node = D[node]
+        if self.rng is not None:
+            self.rng.shuffle(rows)
+        mark, chosen_mark = len(self.trail), len(self.chosen)
+        self.cover(best)
+        count = 0
+        for node in rows:
+            inner = len(self.trail)
+            self.chosen.append((node - self.first) // 4)
+            j = R[node]
+            while j != node:
+                self.cover(C[j])
+                j = R[j]
+            count += self.search(limit - count)
+            if count >= limit:
+                return count
+            self.undo(inner, len(self.chosen) - 1)
+        self.undo(mark, chosen_mark)
+        return count
+
+    def write_to(self, board):
+        size = self.size
+        cells = bytearray(len(board.cells))
+        for r in self.chosen:
+            cells[r // size] = r % size + 1
+        board.cells[:] = cells
@@ -1,11 +1,33 @@
+import collections
 import googleapiclient.errors
+import queue
+import threading
 import time
 import pygame
 import random
 import re
+import string
 import os
 from dotenv import load_dotenv
-from make_suudoku import generate_full_sudoku, remove_numbers_from_board, has_unique_solution
+from make_suudoku import generate_full_sudoku, transform_puzzle
+from puzzle_pool import PuzzlePool
+from puzzle_bank import PuzzleBank
+from difficulty import TIERS
+from render import (
+    Animator,
+    Blink,
+    Bounce,
+    Completion,
+    DirtyRects,
+    FrameStats,
+    LayerCache,
+    RotationFrames,
+    Shake,
+    Wave,
+    color_ramp,
+    glyphs,
+    manhattan_rings,
+)
 from googleapiclient.discovery import build
 
 # .envファイルの読み込み
@@ -33,18 +55,86 @@ def get_live_chat_id(video_id):
     return live_chat_id
 
 
-processed_message_ids = []
+class SeenMessages:
+    # 処理済みのコメント ID。set で O(1) で引き、max_size 件を超えたら古い順に忘れるので、
+    # 長時間の配信でもメモリが増え続けない（1回に取得する 200 件より十分大きくしておく）
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self.ids = set()
+        self.order = collections.deque()
+        self.accepted = 0
+        self.duplicates = 0  # 取り除いた重複の数
+
+    def add(self, message_id):
+        # 初めての ID なら記録して True、処理済みなら False を返す
+        if message_id in self.ids:
+            self.duplicates += 1
+            return False
+        self.ids.add(message_id)
+        self.order.append(message_id)
+        if len(self.order) > self.max_size:
+            self.ids.discard(self.order.popleft())
+        self.accepted += 1
+        return True
+
+    def stats(self):
+        return f"chat messages: {self.accepted} new, {self.duplicates} duplicates dropped, {len(self.ids)} ids kept"
+
+
+processed_message_ids = SeenMessages()
 
 
-def get_live_chat_messages(live_chat_id):
+def get_live_chat_messages(live_chat_id, page_token=None):
+    # page_token には前回の nextPageToken を渡す（前回より後のコメントだけが返る）。
+    # (新しいコメント, 次の page_token, サーバーが指定する次の取得までの秒数) を返す
     response = (
-        youtube.liveChatMessages().list(liveChatId=live_chat_id, part="snippet,authorDetails", maxResults=200).execute()
+        youtube.liveChatMessages()
+        .list(liveChatId=live_chat_id, part="snippet,authorDetails", maxResults=200, pageToken=page_token)
+        .execute()
     )
     messages = response.get("items", [])
 
-    # 未処理のコメントのみをフィルタリング
-    new_messages = [msg for msg in messages if msg["id"] not in processed_message_ids]
-    return new_messages
+    # 未処理のコメントのみをフィルタリング（返したものは処理済みとして記録する）
+    new_messages = [msg for msg in messages if processed_message_ids.add(msg["id"])]
+    interval = response.get("pollingIntervalMillis", CHAT_POLL_INTERVAL * 1000) / 1000
+    return new_messages, response.get("nextPageToken", page_token), interval
+
+
+CHAT_POLL_INTERVAL = 10  # サーバーが取得間隔を返さなかったときの間隔（秒）
+CHAT_MAX_BACKOFF = 300  # 取得に失敗し続けたときに待つ最大の秒数（失敗するたびに倍にしていく）
+MOVES_PER_FRAME = 5  # 1フレームで処理するコメントの上限（残りは次のフレームに回す）
+chat_moves = queue.Queue()  # 取得したコメントのうち、入力の形式（Ab8 など）に合うものの本文
+
+
+def poll_live_chat(channel_id, stop):
+    # 別スレッドでライブコメントを取得し続け、chat_moves に入れる。通信の待ち時間で描画や入力が止まらない
+    live_chat_id = None
+    page_token = None
+    delay = 0  # 最初の取得はすぐに行う
+    failures = 0
+    while not stop.wait(delay):
+        try:
+            if live_chat_id is None:
+                # 配信やチャットがまだ見つからないときも、ほかの失敗と同じように待ってから探し直す
+                video_id = get_live_video_id(channel_id)
+                if video_id is None:
+                    raise LookupError("the channel has no live stream")
+                live_chat_id = get_live_chat_id(video_id)
+            new_messages, page_token, delay = get_live_chat_messages(live_chat_id, page_token)
+            moves = [msg["snippet"]["displayMessage"] for msg in new_messages]
+        except Exception as e:  # 通信エラー（httplib2 の例外を含む）や想定外の応答でもスレッドを止めない
+            if isinstance(e, googleapiclient.errors.HttpError) and (
+                e.resp.status == 404 or b"liveChatEnded" in (e.content or b"")
+            ):
+                live_chat_id = page_token = None  # 配信が終わったら、次の配信を同じ間隔の延ばし方で探し直す
+            failures += 1
+            delay = min(CHAT_MAX_BACKOFF, CHAT_POLL_INTERVAL * 2 ** (failures - 1))
+            print(f"Failed to fetch live chat messages ({failures} in a row, retrying in {delay} s): {e!r}")
+            continue
+        failures = 0
+        for message_text in moves:
+            if COMMENT_PATTERN.match(message_text):
+                chat_moves.put(message_text)
 
 
 # 定数の設定
@@ -57,27 +147,94 @@ FONT_SIZE = 36
 LABEL_FONT_SIZE = 24
 ERROR_FONT_SIZE = 18  # 誤答の文字サイズ
 MARGIN = 50  # 余白を設定
+BOX_SIZE = 3  # ボックスの大きさ（4 なら 16×16、5 なら 25×25 の盤面になる）
+SIZE = BOX_SIZE * BOX_SIZE
+CELL_SIZE = (WIDTH - 2 * MARGIN) // SIZE
+COL_LABELS = string.ascii_uppercase[:SIZE]  # 列のラベル（9×9 なら A〜I）
+ROW_LABELS = COL_LABELS.lower()  # 行のラベル（9×9 なら a〜i）
+# 「列 行 数字」の入力（9×9 なら Ab8、16×16 なら Pp16 のように数字は2桁まで）
+COMMENT_PATTERN = re.compile(
+    rf"([A-{COL_LABELS[-1]}a-{ROW_LABELS[-1]}])([a-{ROW_LABELS[-1]}])(\d{{1,{len(str(SIZE))}}})"
+)
 ANIMATION_DURATION = 3  # アニメーションの長さ（秒）
+TARGET_FPS = 60  # メインループの上限フレームレート。余った時間は眠って CPU を空ける
+FRAME_STATS_INTERVAL = 60  # フレーム時間の分布をログに出す間隔（秒）。None なら終了時だけ
+# 波の距離ごとの色。最大マンハッタン距離（盤面の一辺の長さ）まで、白へ近づけていく
+CORRECT_WAVE = color_ramp(WHITE, (173, 216, 230), SIZE)  # 基本の薄い青色
+WRONG_WAVE = color_ramp(WHITE, (255, 182, 193), SIZE)  # 基本の薄い赤色（ライトピンク）
+CLEAR_ANGLE_STEP = 5  # クリア時のキャラクターを1フレームで回す角度（回転後の画像はこの刻みで作り置きする）
+PUZZLE_POOL_SIZE = 5  # 作り置きしておく問題の数
+FIRST_PUZZLE_WORKERS = None  # 最初の1問を並列に作るプロセス数（None なら1プロセス。多くの場合1プロセスの方が速い）
+TARGET_CLUES = None  # 手がかりの数の目標（例: (22, 30)）。None なら従来どおり
+PUZZLE_BANK = "puzzles.sdk"  # このファイルがあれば、問題を生成せずに問題集から読み込む
+DIFFICULTY = None  # 問題集から選ぶ難易度（"easy" / "medium" / "hard" / "expert" / "extreme"）
 
 
 debug = 0
 
-# Pygameの初期化
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Sudoku Solver")
-font = pygame.font.Font(None, FONT_SIZE)
-label_font = pygame.font.Font(None, LABEL_FONT_SIZE)
-error_font = pygame.font.Font(None, ERROR_FONT_SIZE)
+screen = None
+font = None
+label_font = None
+error_font = None
+clear_font = None
+character_frames = None
+puzzle_pool = None
+bank = None
+board = None
+full_board = None
+
+
+def setup(headless=False):
+    # 画面とパズルプールの初期化
+    # （spawn 方式の子プロセスが import してもウィンドウが開かないよう main() から呼ぶ）
+    # headless なら SDL のダミードライバーで、ウィンドウを開かずに画面と同じ Surface に描く（CI やサーバー用）
+    global screen, font, label_font, error_font, clear_font, character_frames, puzzle_pool, bank, board, full_board
+    if not debug and os.path.exists(PUZZLE_BANK):
+        if DIFFICULTY:
+            # 難易度の索引は全問題の採点に時間がかかるので、起動時には作らない
+            try:
+                bank = PuzzleBank(PUZZLE_BANK, key="level", rebuild=False)
+            except ValueError as e:
+                raise SystemExit(f"{e}; run: python difficulty.py {PUZZLE_BANK}")
+        else:
+            bank = PuzzleBank(PUZZLE_BANK, key="clues")
+        if bank.box != BOX_SIZE:  # 盤面の大きさが違う問題集は使わない
+            bank.close()
+            bank = None
+    if not debug and bank is None:
+        # SDL のシグナルハンドラを引き継がないよう、pygame の初期化より先にプロセスを起動する
+        puzzle_pool = PuzzlePool(PUZZLE_POOL_SIZE, TARGET_CLUES, BOX_SIZE, FIRST_PUZZLE_WORKERS)
+
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Sudoku Solver")
+    # 16×16 以上ではセルが小さくなるので、文字もセルに収まる大きさまで縮める
+    font = pygame.font.Font(None, min(FONT_SIZE, CELL_SIZE * 2 // 3))
+    label_font = pygame.font.Font(None, min(LABEL_FONT_SIZE, CELL_SIZE * 2 // 3))
+    error_font = pygame.font.Font(None, min(ERROR_FONT_SIZE, CELL_SIZE // 2))
+    clear_font = pygame.font.Font(None, 72)  # クリア文字用フォントサイズ
+    # クリア時のキャラクターは起動時に1回だけ読み込み、回転させた画像は角度ごとに使い回す
+    character_image = pygame.image.load("goaled_character.png").convert_alpha()
+    character_frames = RotationFrames(pygame.transform.scale(character_image, (160, 160)), CLEAR_ANGLE_STEP)
+
+    # 数独ボードの生成
+    board, full_board = new_game()
 
-# 数独ボードの生成
-full_board = generate_full_sudoku()
-board = full_board
-if not debug:
-    board = remove_numbers_from_board([row[:] for row in full_board])
-if debug:
-    board = [row[:] for row in full_board]
-    board[0][0] = 0
+
+def new_game():
+    if debug:
+        full_board = generate_full_sudoku(box=BOX_SIZE)
+        board = full_board.copy()
+        board[0, 0] = 0
+        return board, full_board
+    if bank is not None:
+        # 問題集から読み込み、さらに変換をかけて同じ問題でも見た目を変える
+        if DIFFICULTY:
+            return transform_puzzle(*bank.random_puzzle(*TIERS[DIFFICULTY]))
+        return transform_puzzle(*bank.random_puzzle(*(TARGET_CLUES or (None, None))))
+    return puzzle_pool.pop()  # 作り置きの問題を取り出す
 
 
 # 入力の記録
@@ -85,56 +242,110 @@ user_inputs = {}
 input_buffer = ""  # 入力バッファ
 
 
-def draw_board(board):
-    screen.fill(WHITE)
-    cell_size = (WIDTH - 2 * MARGIN) // 9  # セルのサイズを計算
-    board_height = MARGIN + 9 * cell_size  # ボードの高さを計算
-    board_width = MARGIN + 9 * cell_size  # ボードの幅を計算
+def build_board_layer():
+    # 1ゲームの間変わらない背景（白地・罫線・外枠・行と列のラベル）を1枚の Surface に描いておく
+    layer = pygame.Surface(screen.get_size()).convert()
+    layer.fill(WHITE)
+    cell_size = CELL_SIZE  # セルのサイズ
+    board_height = MARGIN + SIZE * cell_size  # ボードの高さを計算
+    board_width = MARGIN + SIZE * cell_size  # ボードの幅を計算
 
-    for i in range(10):
-        thickness = 1 if i % 3 != 0 else 3
+    for i in range(SIZE + 1):
+        thickness = 1 if i % BOX_SIZE != 0 else 3
         x_start = MARGIN + i * cell_size
         y_start = MARGIN + i * cell_size
 
-        pygame.draw.line(screen, BLACK, (x_start, MARGIN), (x_start, board_height), thickness)
-        pygame.draw.line(screen, BLACK, (MARGIN, y_start), (board_width, y_start), thickness)
+        pygame.draw.line(layer, BLACK, (x_start, MARGIN), (x_start, board_height), thickness)
+        pygame.draw.line(layer, BLACK, (MARGIN, y_start), (board_width, y_start), thickness)
 
     # 外枠の描画
-    pygame.draw.line(screen, BLACK, (MARGIN, MARGIN), (board_width, MARGIN), 3)
-    pygame.draw.line(screen, BLACK, (MARGIN, MARGIN), (MARGIN, board_height), 3)
-    pygame.draw.line(screen, BLACK, (board_width, MARGIN), (board_width, board_height), 3)
-    pygame.draw.line(screen, BLACK, (MARGIN, board_height), (board_width, board_height), 3)
-
-    for i in range(9):
-        for j in range(9):
-            if board[i][j] != 0:
-                text_color = BLUE if (i, j) not in user_inputs else BLACK
-                text = font.render(str(board[i][j]), True, text_color)
-                text_rect = text.get_rect(
-                    center=(MARGIN + j * cell_size + cell_size // 2, MARGIN + i * cell_size + cell_size // 2)
-                )
-                screen.blit(text, text_rect)
-
-    draw_user_inputs(cell_size)  # ユーザー入力の描画
-    draw_labels(cell_size)  # 行と列のラベルの描画
-    pygame.display.flip()
-
-
-def draw_labels(cell_size):
-    cols = "ABCDEFGHI"
-    rows = "abcdefghi"
-    for i in range(9):
-        col_label = label_font.render(cols[i], True, BLACK)
-        row_label = label_font.render(rows[i], True, BLACK)
+    pygame.draw.line(layer, BLACK, (MARGIN, MARGIN), (board_width, MARGIN), 3)
+    pygame.draw.line(layer, BLACK, (MARGIN, MARGIN), (MARGIN, board_height), 3)
+    pygame.draw.line(layer, BLACK, (board_width, MARGIN), (board_width, board_height), 3)
+    pygame.draw.line(layer, BLACK, (MARGIN, board_height), (board_width, board_height), 3)
+
+    draw_labels(layer, cell_size)  # 行と列のラベルの描画
+    return layer
+
+
+board_layer = LayerCache(build_board_layer)  # ウィンドウや盤面の大きさが変わったときだけ作り直す
+dirty = DirtyRects()  # このフレームで描き換えた領域。dirty.present() でまとめて画面に送る
+
+
+def background():
+    return board_layer.get((screen.get_size(), BOX_SIZE))
+
+
+def cell_rect(row, col):
+    return pygame.Rect(MARGIN + col * CELL_SIZE, MARGIN + row * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+
+
+def comment_rect():
+    # ボードの下のコメント欄
+    top = MARGIN + SIZE * CELL_SIZE + 10
+    return pygame.Rect(MARGIN, top, WIDTH - MARGIN, HEIGHT - top)
+
+
+def draw_board(board):
+    screen.blit(background(), (0, 0))  # 背景は1回の blit で描く
+    for i in range(SIZE):
+        for j in range(SIZE):
+            draw_cell(board, i, j)
+    dirty.add_all()
+
+
+def draw_cell(board, row, col):
+    # セルの数字と誤答の印を描く（背景は描かない）
+    cell_size = CELL_SIZE  # セルのサイズ
+    if board[row, col] != 0:
+        text_color = BLUE if (row, col) not in user_inputs else BLACK
+        text = glyphs.render(font, str(board[row, col]), text_color)
+        text_rect = text.get_rect(
+            center=(MARGIN + col * cell_size + cell_size // 2, MARGIN + row * cell_size + cell_size // 2)
+        )
+        screen.blit(text, text_rect)
+    for num in user_inputs.get((row, col), ()):
+        if 1 <= num <= SIZE:
+            x_offset, y_offset = error_position(num)
+            x = MARGIN + col * cell_size + int(cell_size * x_offset)
+            y = MARGIN + row * cell_size + int(cell_size * y_offset)
+            text = glyphs.render(error_font, f"x{num}", RED)
+            text_rect = text.get_rect(center=(x, y))
+            screen.blit(text, text_rect)
+
+
+def redraw_region(rect):
+    # rect の範囲だけを背景から描き直し、その範囲を更新対象にする（範囲の外には描かない）
+    rect = pygame.Rect(rect).clip(screen.get_rect())
+    if not rect:
+        return
+    screen.set_clip(rect)
+    screen.blit(background(), rect, rect)
+    area = rect.inflate(CELL_SIZE, CELL_SIZE)  # 隣のセルからはみ出した誤答の印も描き直す
+    first_row, last_row = max(0, (area.top - MARGIN) // CELL_SIZE), min(SIZE - 1, (area.bottom - MARGIN) // CELL_SIZE)
+    first_col, last_col = max(0, (area.left - MARGIN) // CELL_SIZE), min(SIZE - 1, (area.right - MARGIN) // CELL_SIZE)
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            draw_cell(board, row, col)
+    if rect.colliderect(comment_rect()):
+        draw_comments()
+    screen.set_clip(None)
+    dirty.add(rect)
+
+
+def draw_labels(surface, cell_size):
+    for i in range(SIZE):
+        col_label = glyphs.render(label_font, COL_LABELS[i], BLACK)
+        row_label = glyphs.render(label_font, ROW_LABELS[i], BLACK)
         col_label_rect = col_label.get_rect(center=(MARGIN + i * cell_size + cell_size // 2, MARGIN - 20))
         row_label_rect = row_label.get_rect(center=(MARGIN - 20, MARGIN + i * cell_size + cell_size // 2))
-        screen.blit(col_label, col_label_rect)
-        screen.blit(row_label, row_label_rect)
+        surface.blit(col_label, col_label_rect)
+        surface.blit(row_label, row_label_rect)
 
 
 def parse_comment(comment):
     # 入力をすべて大文字に変換し、小文字を無視するようにする
-    match = re.match(r"([A-Ia-i])([a-i])([1-9])", comment)
+    match = COMMENT_PATTERN.match(comment)
     if not match:
         return None
     col, row, num = match.groups()
@@ -144,50 +355,42 @@ def parse_comment(comment):
     col = ord(col) - ord("A")
     row = ord(row) - ord("a")
     num = int(num)
+    if not 1 <= num <= SIZE:
+        return None
     return row, col, num
 
 
 def check_completion(board):
-    for row in board:
-        if 0 in row:
-            return False
-    return True
-
+    return board.is_complete()
 
-def show_completion_animation():
-    clear_font = pygame.font.Font(None, 72)  # クリア文字用フォントサイズ
-    character_image = pygame.image.load("goaled_character.png")
-    character_image = pygame.transform.scale(character_image, (160, 160))
-    character_rect = character_image.get_rect(center=(WIDTH // 2, HEIGHT // 2))
 
-    for angle in range(0, 1801, 5):
-        draw_board(board)
-        display_comments()  # コメントの表示を追加
-        rotated_image = pygame.transform.rotate(character_image, angle)
-        rotated_rect = rotated_image.get_rect(center=character_rect.center)
+def show_completion_animation(delay=0):
+    # 回転が終わったら次の問題に進む
+    animate_completion(delay, on_done=next_game)
 
-        screen.blit(rotated_image, rotated_rect.topleft)
 
-        text = clear_font.render("CLEAR!!!", True, RED)
-        text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 4))
-        screen.blit(text, text_rect)
-
-        pygame.display.flip()
-        pygame.time.wait(30)
-    pygame.time.wait(500)
+def next_game():
+    global board, full_board, user_inputs, displayed_comments
+    board, full_board = new_game()
+    user_inputs = {}
+    displayed_comments = []
+    draw_board(board)
+    display_comments()
 
 
 displayed_comments = []
 
 
 def display_comments():
-    cell_size = (WIDTH - 2 * MARGIN) // 9  # セルのサイズを計算
-    start_y = MARGIN + 9 * cell_size + 10  # ボードの下に表示
+    redraw_region(comment_rect())  # コメント欄だけを描き直す
+
+
+def draw_comments():
+    start_y = comment_rect().top  # ボードの下に表示
     for i, comment in enumerate(displayed_comments[-5:]):  # 最新の5つのコメントを表示
-        text = font.render(comment, True, BLACK)
+        text = glyphs.render(font, comment, BLACK)
         text_rect = text.get_rect(topleft=(MARGIN, start_y + i * 30))
         screen.blit(text, text_rect)
-    pygame.display.flip()
 
 
 def handle_input(board, full_board, comment):
@@ -196,18 +399,18 @@ def handle_input(board, full_board, comment):
         return "Invalid input format. Use format 'Ab8'."
     row, col, num = parsed
     cell_position = f"{chr(col + ord('A'))}{chr(row + ord('a'))}{num}"
-    if board[row][col] != 0:
+    if board[row, col] != 0:
         displayed_comments.append(f"- : {cell_position} -> {comment}")
         animate_cell_already_filled(row, col)
         return f"Cell {comment[:2]} is already solved."
-    if full_board[row][col] == num:
+    if full_board[row, col] == num:
         displayed_comments.append(f"o : {cell_position} -> {comment}")
-        animate_correct_input(row, col, num)
-        board[row][col] = num
+        delay = animate_correct_input(row, col, num)
+        board[row, col] = num
         if (row, col) in user_inputs:
             del user_inputs[(row, col)]  # 正解したので誤答の出力を削除
         if check_completion(board):
-            show_completion_animation()
+            show_completion_animation(delay)  # 波が終わってから回す
         return f"Placed {num} at {comment[:2]}."
     else:
         displayed_comments.append(f"x : {cell_position} -> {comment}")
@@ -220,241 +423,73 @@ def handle_input(board, full_board, comment):
         return f"{num} is not a valid number for cell {comment[:2]}."
 
 
-def draw_user_inputs(cell_size):
-    error_positions = {
-        1: (0.2, 0.2),
-        2: (0.5, 0.2),
-        3: (0.8, 0.2),
-        4: (0.2, 0.5),
-        5: (0.5, 0.5),
-        6: (0.8, 0.5),
-        7: (0.2, 0.8),
-        8: (0.5, 0.8),
-        9: (0.8, 0.8),
-    }
-    for (row, col), nums in user_inputs.items():
-        for num in nums:
-            if num in error_positions:
-                x_offset, y_offset = error_positions[num]
-                x = MARGIN + col * cell_size + int(cell_size * x_offset)
-                y = MARGIN + row * cell_size + int(cell_size * y_offset)
-                text = error_font.render(f"x{num}", True, RED)
-                text_rect = text.get_rect(center=(x, y))
-                screen.blit(text, text_rect)
+def error_position(num):
+    # 誤答 num を表示するセル内の位置。BOX_SIZE × BOX_SIZE に並べる（9×9 なら 1 が左上、9 が右下）
+    row, col = divmod(num - 1, BOX_SIZE)
+    step = 0.6 / (BOX_SIZE - 1)
+    return 0.2 + col * step, 0.2 + row * step
 
 
 def animate_correct_input(row, col, num):
-    cell_size = (WIDTH - 2 * MARGIN) // 9
-    x = MARGIN + col * cell_size + cell_size // 2
-    y = MARGIN + row * cell_size + cell_size // 2
-    total_frames = 20  # フレーム数を増やしてスピードをゆっくりにする
-
-    # バウンドアニメーション
-    for i in range(total_frames):
-        offset = (total_frames - i) if i < total_frames / 2 else (i - total_frames / 2)
-        scale = 10 - 9 * (i / total_frames)  # 最初10倍にし、徐々に1倍に近づける
-        screen.fill(WHITE, (x - cell_size // 2, y - cell_size // 2, cell_size, cell_size))
-        draw_board(board)
-        display_comments()  # コメントの表示を追加
-        text = font.render(str(num), True, BLUE)
-        text_rect = text.get_rect(center=(x, y - offset))
-        text = pygame.transform.scale(text, (int(text_rect.width * scale), int(text_rect.height * scale)))
-        text_rect = text.get_rect(center=(x, y - offset))
-        screen.blit(text, text_rect)
-        pygame.display.flip()
-        pygame.time.wait(int(ANIMATION_DURATION * 100 / total_frames))
-
-    # マンハッタン距離に基づく波状アニメーションの追加
-    max_distance = 9  # 最大マンハッタン距離を9に設定
-    base_color = (173, 216, 230)  # 基本の薄い青色
-    for distance in range(1, max_distance + 1):
-        draw_board(board)
-        draw_user_inputs(cell_size)
-        display_comments()  # コメントの表示を追加
-        for dx in range(-distance, distance + 1):
-            for dy in range(-distance, distance + 1):
-                if abs(dx) + abs(dy) == distance:  # マンハッタン距離が一致するセルを処理
-                    new_row = row + dy
-                    new_col = col + dx
-                    if 0 <= new_row < 9 and 0 <= new_col < 9:
-                        propagate_x = MARGIN + new_col * cell_size + cell_size // 2
-                        propagate_y = MARGIN + new_row * cell_size + cell_size // 2
-                        color_intensity = 1 - (distance - 1) / (max_distance - 1)
-                        wave_color = (
-                            int(WHITE[0] * (1 - color_intensity) + base_color[0] * color_intensity),
-                            int(WHITE[1] * (1 - color_intensity) + base_color[1] * color_intensity),
-                            int(WHITE[2] * (1 - color_intensity) + base_color[2] * color_intensity),
-                        )
-                        pygame.draw.rect(
-                            screen,
-                            wave_color,
-                            (propagate_x - cell_size // 2, propagate_y - cell_size // 2, cell_size, cell_size),
-                        )
-                        if board[new_row][new_col] != 0:  # 数字がある場合のみ表示
-                            text = font.render(str(board[new_row][new_col]), True, BLUE)
-                            text_rect = text.get_rect(center=(propagate_x, propagate_y))
-                            screen.blit(text, text_rect)
-        pygame.display.flip()
-        pygame.time.wait(100)  # 各距離ごとに一時停止
-    draw_board(board)
-    draw_user_inputs(cell_size)
-    display_comments()  # コメントの表示を追加
-    pygame.display.flip()
+    # バウンドのあとにマンハッタン距離に基づく波を再生する。すべて終わるまでの秒数を返す
+    text = glyphs.render(font, str(num), BLUE)
+    delay = animator.start(Bounce(screen, cell_rect(row, col), text, ANIMATION_DURATION / 10))
+    return animator.start(wave(row, col, CORRECT_WAVE), delay)
 
 
 def animate_cell_already_filled(row, col):
-    cell_size = (WIDTH - 2 * MARGIN) // 9
-    x = MARGIN + col * cell_size + cell_size // 2
-    y = MARGIN + row * cell_size + cell_size // 2
-    for _ in range(3):
-        pygame.draw.rect(screen, RED, (x - cell_size // 2, y - cell_size // 2, cell_size, cell_size), 3)
-        pygame.display.flip()
-        pygame.time.wait(100)
-        pygame.draw.rect(screen, WHITE, (x - cell_size // 2, y - cell_size // 2, cell_size, cell_size), 3)
-        draw_board(board)
-        draw_user_inputs(cell_size)
-        display_comments()  # コメントの表示を追加
-        pygame.display.flip()
-        pygame.time.wait(100)
-
-    max_distance = 9  # 最大マンハッタン距離を9に設定
-    base_color = (255, 182, 193)  # 基本の薄い赤色（ライトピンク）
-
-    for distance in range(1, max_distance + 1):
-        draw_board(board)
-        draw_user_inputs(cell_size)
-        display_comments()  # コメントの表示を追加
-        for dx in range(-distance, distance + 1):
-            for dy in range(-distance, distance + 1):
-                if abs(dx) + abs(dy) == distance:  # マンハッタン距離が一致するセルを処理
-                    new_row = row + dy
-                    new_col = col + dx
-                    if 0 <= new_row < 9 and 0 <= new_col < 9:
-                        propagate_x = MARGIN + new_col * cell_size + cell_size // 2
-                        propagate_y = MARGIN + new_row * cell_size + cell_size // 2
-                        color_intensity = 1 - (distance - 1) / (max_distance - 1)
-                        wave_color = (
-                            int(WHITE[0] * (1 - color_intensity) + base_color[0] * color_intensity),
-                            int(WHITE[1] * (1 - color_intensity) + base_color[1] * color_intensity),
-                            int(WHITE[2] * (1 - color_intensity) + base_color[2] * color_intensity),
-                        )
-                        pygame.draw.rect(
-                            screen,
-                            wave_color,
-                            (propagate_x - cell_size // 2, propagate_y - cell_size // 2, cell_size, cell_size),
-                        )
-                        if board[new_row][new_col] != 0:  # 数字がある場合のみ表示
-                            text = font.render(str(board[new_row][new_col]), True, BLUE)
-                            text_rect = text.get_rect(center=(propagate_x, propagate_y))
-                            screen.blit(text, text_rect)
-                        elif (new_row, new_col) == (row, col):  # 不正解の値を表示
-                            text = font.render("X", True, RED)
-                            text_rect = text.get_rect(center=(propagate_x, propagate_y))
-                            screen.blit(text, text_rect)
-        pygame.display.flip()
-        pygame.time.wait(100)  # 各距離ごとに一時停止
-    draw_board(board)
-    draw_user_inputs(cell_size)
-    pygame.display.flip()
+    delay = animator.start(Blink(screen, cell_rect(row, col), RED))
+    return animator.start(wave(row, col, WRONG_WAVE), delay)
 
 
 def animate_incorrect_input(row, col, incorrect_value):
-    cell_size = (WIDTH - 2 * MARGIN) // 9
-    x = MARGIN + col * cell_size + cell_size // 2
-    y = MARGIN + row * cell_size + cell_size // 2
-
-    # シェイクアニメーション
-    for _ in range(2):
-        for dx in [-5, 5, -3, 3, -1, 1, 0]:
-            screen.fill(WHITE, (x - cell_size // 2, y - cell_size // 2, cell_size, cell_size))
-            draw_board(board)
-            draw_user_inputs(cell_size)
-            display_comments()  # コメントの表示を追加
-            text = font.render(str(incorrect_value), True, RED)  # 不正解の値を表示
-            text_rect = text.get_rect(center=(x + dx, y))
-            screen.blit(text, text_rect)
-            pygame.display.flip()
-            pygame.time.wait(int(ANIMATION_DURATION * 100 / 10))
-
-    # 波状アニメーションの追加
-    max_distance = 9  # 最大マンハッタン距離を9に設定
-    base_color = (255, 182, 193)  # 基本の薄い赤色（ライトピンク）
-
-    for distance in range(1, max_distance + 1):
-        draw_board(board)
-        draw_user_inputs(cell_size)
-        display_comments()  # コメントの表示を追加
-        for dx in range(-distance, distance + 1):
-            for dy in range(-distance, distance + 1):
-                if abs(dx) + abs(dy) == distance:  # マンハッタン距離が一致するセルを処理
-                    new_row = row + dy
-                    new_col = col + dx
-                    if 0 <= new_row < 9 and 0 <= new_col < 9:
-                        propagate_x = MARGIN + new_col * cell_size + cell_size // 2
-                        propagate_y = MARGIN + new_row * cell_size + cell_size // 2
-                        color_intensity = 1 - (distance - 1) / (max_distance - 1)
-                        wave_color = (
-                            int(WHITE[0] * (1 - color_intensity) + base_color[0] * color_intensity),
-                            int(WHITE[1] * (1 - color_intensity) + base_color[1] * color_intensity),
-                            int(WHITE[2] * (1 - color_intensity) + base_color[2] * color_intensity),
-                        )
-                        pygame.draw.rect(
-                            screen,
-                            wave_color,
-                            (propagate_x - cell_size // 2, propagate_y - cell_size // 2, cell_size, cell_size),
-                        )
-                        if board[new_row][new_col] != 0:  # 数字がある場合のみ表示
-                            text = font.render(str(board[new_row][new_col]), True, BLUE)
-                            text_rect = text.get_rect(center=(propagate_x, propagate_y))
-                            screen.blit(text, text_rect)
-                        elif (new_row, new_col) == (row, col):  # 不正解の値を表示
-                            text = font.render(str(incorrect_value), True, RED)
-                            text_rect = text.get_rect(center=(propagate_x, propagate_y))
-                            screen.blit(text, text_rect)
-        pygame.display.flip()
-        pygame.time.wait(100)  # 各距離ごとに一時停止
-    draw_board(board)
-    draw_user_inputs(cell_size)
-    display_comments()  # コメントの表示を追加
-    pygame.display.flip()
+    text = glyphs.render(font, str(incorrect_value), RED)  # 不正解の値を表示
+    delay = animator.start(Shake(screen, cell_rect(row, col), text, ANIMATION_DURATION / 100))
+    return animator.start(wave(row, col, WRONG_WAVE), delay)
+
+
+def animate_completion(delay=0, on_done=None):
+    # 「CLEAR!!!」の文字とキャラクターを回転させる
+    text = glyphs.render(clear_font, "CLEAR!!!", RED)
+    effect = Completion(screen, character_frames, text, (WIDTH // 2, HEIGHT // 4), (WIDTH // 2, HEIGHT // 2))
+    return animator.start(effect, delay, on_done)
+
+
+def wave(row, col, colors):
+    return Wave(screen, manhattan_rings(SIZE, row, col), colors, cell_rect, cell_number, font, BLUE)
+
+
+def cell_number(row, col):
+    return board[row, col]  # 波が届いた時点の盤面の数字（次のゲームに移っていれば新しい盤面）
+
+
+animator = Animator(redraw_region, dirty)  # 再生中のアニメーション。メインループが毎フレーム進める
 
 
 def main():
     running = True
-    global input_buffer, board, full_board, user_inputs, displayed_comments  # グローバル変数を使って入力バッファを更新
+    global input_buffer  # グローバル変数を使って入力バッファを更新
+    setup()
     draw_board(board)
     display_comments()  # コメントの表示
+    dirty.present()
 
-    last_fetch_time = time.time()
-    video_id = get_live_video_id(CHANNEL_ID)
-    live_chat_id = get_live_chat_id(video_id) if video_id else None
+    stop_polling = threading.Event()
+    threading.Thread(target=poll_live_chat, args=(CHANNEL_ID, stop_polling), daemon=True).start()
+    clock = pygame.time.Clock()
+    frame_stats = FrameStats()
+    last_stats_time = time.time()
     while running:
-        current_time = time.time()
-        # ライブコメント
-        if live_chat_id and current_time - last_fetch_time >= 10:
-            new_messages = get_live_chat_messages(live_chat_id)
-            for msg in new_messages:
-                message_text = msg["snippet"]["displayMessage"]
-                processed_message_ids.append(msg["id"])
-                message = handle_input(board, full_board, message_text)
-                print(message)
-                draw_board(board)
-                display_comments()
-                # 数独が完成した場合、新しい数独を生成
-                if check_completion(board):
-                    full_board = generate_full_sudoku()
-                    if not debug:
-                        board = remove_numbers_from_board([row[:] for row in full_board])
-                    else:
-                        board = [row[:] for row in full_board]
-                        board[0][0] = 0
-
-                    user_inputs = {}
-                    displayed_comments = []
-                    draw_board(board)
-                    display_comments()
-
-            last_fetch_time = current_time
+        frame_stats.begin()
+        # ライブコメント（別スレッドが取得したものを、1フレームに MOVES_PER_FRAME 件まで処理する）
+        handled = 0
+        while handled < MOVES_PER_FRAME and not chat_moves.empty():
+            message = handle_input(board, full_board, chat_moves.get())
+            print(message)
+            handled += 1
+        if handled:
+            draw_board(board)
+            display_comments()
         # 手動でのキー入力？
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -467,26 +502,34 @@ def main():
                     display_comments()  # コメントの表示
                     input_buffer = ""  # 入力バッファをクリア
 
-                    # 数独が完成した場合、新しい数独を生成
-                    if check_completion(board):
-                        full_board = generate_full_sudoku()
-                        if not debug:
-                            board = remove_numbers_from_board([row[:] for row in full_board])
-                        else:
-                            board = [row[:] for row in full_board]
-                            board[0][0] = 0
-
-                        user_inputs = {}
-                        displayed_comments = []
-                        draw_board(board)
-                        display_comments()
-
                 elif event.key == pygame.K_BACKSPACE:
                     input_buffer = input_buffer[:-1]
                 else:
                     input_buffer += event.unicode
                 print(f"Current input: {input_buffer}")  # デバッグ用に現在の入力を表示
 
+        frame_stats.mark("update")
+
+        # アニメーションを進めて、変わった範囲だけを画面に送る（数独が完成したら回転のあとに次の問題へ）
+        animator.update()
+        frame_stats.mark("draw")
+        dirty.present()
+        frame_stats.mark("present")
+        frame_stats.add("frame", clock.tick(TARGET_FPS) / 1000)  # 眠った時間も含めた1フレームの長さ
+        if FRAME_STATS_INTERVAL and time.time() - last_stats_time >= FRAME_STATS_INTERVAL:
+            print(frame_stats.summary())
+            last_stats_time = time.time()
+
+    stop_polling.set()
+    if puzzle_pool:
+        puzzle_pool.close()
+    if bank is not None:
+        bank.close()
+    print(glyphs.stats())
+    print(board_layer.stats())
+    print(dirty.stats())
+    print(processed_message_ids.stats())
+    print(frame_stats.summary())
     pygame.quit()
 
 
@@ -1,96 +1,710 @@
+import collections
+import itertools
 import random
+import time
+
+class Geometry:
+    # ボックスの大きさ box（9×9 なら 3、16×16 なら 4、25×25 なら 5）から決まる盤面の形状。
+    # セル番号 0〜area-1 と 行・列・ボックスの対応表を持つ
+    __slots__ = ("box", "size", "area", "all_digits", "cell_row", "cell_col", "cell_box", "units", "peers")
+
+    def __init__(self, box):
+        size = box * box
+        area = size * size
+        self.box = box
+        self.size = size
+        self.area = area
+        self.all_digits = (1 << size) - 1  # 1〜size がすべて使える状態のビットマスク
+        self.cell_row = [i // size for i in range(area)]
+        self.cell_col = [i % size for i in range(area)]
+        self.cell_box = [box * (self.cell_row[i] // box) + self.cell_col[i] // box for i in range(area)]
+        boxes = [[] for _ in range(size)]
+        for i in range(area):
+            boxes[self.cell_box[i]].append(i)
+        self.units = (
+            [[r * size + c for c in range(size)] for r in range(size)]
+            + [[r * size + c for r in range(size)] for c in range(size)]
+            + boxes
+        )
+        units = self.units
+        self.peers = [
+            sorted(
+                set(units[self.cell_row[i]] + units[size + self.cell_col[i]] + units[2 * size + self.cell_box[i]])
+                - {i}
+            )
+            for i in range(area)
+        ]
+
+_geometries = {}
+
+def geometry(box=3):
+    if box not in _geometries:
+        if not 2 <= box <= 5:
+            raise ValueError(f"unsupported box size: {box}")  # 数字を1文字で書けるのは 25 まで
+        _geometries[box] = Geometry(box)
+    return _geometries[box]
+
+def box_of_area(area):
+    # セル数（81, 256, 625）からボックスの大きさを求める
+    box = round(area**0.25)
+    if box**4 != area:
+        raise ValueError(f"{area} cells is not a square sudoku board")
+    return box
+
+# 9×9 の盤面の形状（他のモジュールから 9×9 を前提に使う）
+GEOMETRY = geometry(3)
+SIZE = GEOMETRY.size
+BOX = GEOMETRY.box
+CELLS = GEOMETRY.area
+ALL_DIGITS = GEOMETRY.all_digits
+CELL_ROW = GEOMETRY.cell_row
+CELL_COL = GEOMETRY.cell_col
+CELL_BOX = GEOMETRY.cell_box
+UNITS = GEOMETRY.units
+# セルの値 → 文字。10 以上は 'A'〜'P'（16×16 や 25×25 用）。読み込みでは小文字も受け付ける
+DIGIT_CHARS = "0123456789ABCDEFGHIJKLMNOP"
+TO_ASCII = bytes(ord(DIGIT_CHARS[i]) if i < len(DIGIT_CHARS) else (i + 48) % 256 for i in range(256))
+FROM_ASCII = bytes(
+    DIGIT_CHARS.index(chr(i).upper()) if chr(i).upper() in DIGIT_CHARS else (i - 48) % 256 for i in range(256)
+)
+
+class Board:
+    # size × size マスを1次元の bytearray で持つ盤面。board[row, col] で読み書きする
+    __slots__ = ("cells", "box_size")
+
+    def __init__(self, cells=None, box=3):
+        self.box_size = box
+        self.cells = bytearray(box**4) if cells is None else bytearray(cells)
+
+    @property
+    def size(self):
+        return self.box_size * self.box_size
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        return cls((num for row in rows for num in row), box_of_area(len(rows) ** 2))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # 1セル1文字（'0' と '.' が空き）。長さからボックスの大きさを決める
+        data = bytes(data)
+        return cls(data.replace(b".", b"0").translate(FROM_ASCII), box_of_area(len(data)))
+
+    @classmethod
+    def from_string(cls, text):
+        return cls.from_bytes(text.encode("ascii"))
+
+    def to_bytes(self):
+        return bytes(self.cells).translate(TO_ASCII)
+
+    def to_string(self):
+        return self.to_bytes().decode("ascii")
+
+    def to_rows(self):
+        return [list(self.row(r)) for r in range(self.size)]
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.cells = self.cells[:]
+        board.box_size = self.box_size
+        return board
+
+    def row(self, r):
+        size = self.box_size * self.box_size
+        return memoryview(self.cells)[r * size : (r + 1) * size]
+
+    def col(self, c):
+        return memoryview(self.cells)[c :: self.box_size * self.box_size]
+
+    def box(self, b):
+        cells = self.cells
+        geo = geometry(self.box_size)
+        return bytes(cells[i] for i in geo.units[2 * geo.size + b])
+
+    def clues(self):
+        return len(self.cells) - self.cells.count(0)
+
+    def is_complete(self):
+        return 0 not in self.cells
+
+    def __getitem__(self, pos):
+        row, col = pos
+        return self.cells[row * self.box_size * self.box_size + col]
+
+    def __setitem__(self, pos, num):
+        row, col = pos
+        self.cells[row * self.box_size * self.box_size + col] = num
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.box_size == other.box_size and self.cells == other.cells
+
+    def __hash__(self):
+        return hash(bytes(self.cells))
+
+    def __reduce__(self):
+        return (Board, (bytes(self.cells), self.box_size))
+
+    def __repr__(self):
+        return f"Board.from_string({self.to_string()!r})"
+
+    def __str__(self):
+        width = len(str(self.size))
+        return "\n".join(" ".join(f"{num:>{width}}" for num in self.row(r)) for r in range(self.size))
+
+class BitmaskSolver:
+    # 行・列・ボックスごとに使用済みの数字をビットマスクで持ち、
+    # 候補の少ないセルから探索しつつ naked / hidden single を伝播する
+    __slots__ = (
+        "cells",
+        "rows",
+        "cols",
+        "boxes",
+        "trail",
+        "rng",
+        "nodes",
+        "box",
+        "area",
+        "all_digits",
+        "cell_row",
+        "cell_col",
+        "cell_box",
+        "units",
+    )
+
+    def __init__(self, rng=None, box=3):
+        geo = geometry(box)
+        self.box = box
+        self.area = geo.area
+        self.all_digits = geo.all_digits
+        self.cell_row, self.cell_col, self.cell_box, self.units = geo.cell_row, geo.cell_col, geo.cell_box, geo.units
+        self.cells = [0] * geo.area
+        self.rows = [0] * geo.size
+        self.cols = [0] * geo.size
+        self.boxes = [0] * geo.size
+        self.trail = []  # 置いたセルの履歴（バックトラック用）
+        self.rng = rng  # None なら数字を小さい順に試す
+        self.nodes = 0
+
+    def load(self, board):
+        # 同じインスタンスを使い回せるよう、リストは作り直さずに初期化する
+        if board.box_size != self.box:
+            raise ValueError(f"solver is for box size {self.box}, board has {board.box_size}")
+        cells, rows, cols, boxes = self.cells, self.rows, self.cols, self.boxes
+        cell_row, cell_col, cell_box = self.cell_row, self.cell_col, self.cell_box
+        cells[:] = board.cells
+        for i in range(len(rows)):
+            rows[i] = cols[i] = boxes[i] = 0
+        self.trail.clear()
+        self.nodes = 0
+        for i, num in enumerate(cells):
+            if num:
+                r, c, b = cell_row[i], cell_col[i], cell_box[i]
+                bit = 1 << (num - 1)
+                if (rows[r] | cols[c] | boxes[b]) & bit or num > len(rows):
+                    return False  # 初期配置の時点で矛盾している
+                rows[r] |= bit
+                cols[c] |= bit
+                boxes[b] |= bit
+        return True
+
+    def candidates(self, i):
+        used = self.rows[self.cell_row[i]] | self.cols[self.cell_col[i]] | self.boxes[self.cell_box[i]]
+        return self.all_digits & ~used
+
+    def place(self, i, num):
+        bit = 1 << (num - 1)
+        self.cells[i] = num
+        self.rows[self.cell_row[i]] |= bit
+        self.cols[self.cell_col[i]] |= bit
+        self.boxes[self.cell_box[i]] |= bit
+        self.trail.append(i)
+
+    def undo(self, mark):
+        cells, trail, rows, cols, boxes = self.cells, self.trail, self.rows, self.cols, self.boxes
+        cell_row, cell_col, cell_box = self.cell_row, self.cell_col, self.cell_box
+        while len(trail) > mark:
+            i = trail.pop()
+            bit = ~(1 << (cells[i] - 1))
+            cells[i] = 0
+            rows[cell_row[i]] &= bit
+            cols[cell_col[i]] &= bit
+            boxes[cell_box[i]] &= bit
+
+    def propagate(self):
+        # 確定するセルがなくなるまで naked single と hidden single を埋める。
+        # 16×16 以上でも速いよう、候補の計算はメソッドを呼ばずにその場で行う
+        cells, rows, cols, boxes = self.cells, self.rows, self.cols, self.boxes
+        cell_row, cell_col, cell_box = self.cell_row, self.cell_col, self.cell_box
+        all_digits, place = self.all_digits, self.place
+        changed = True
+        while changed:
+            changed = False
+            for i in range(self.area):
+                if cells[i] == 0:
+                    mask = all_digits & ~(rows[cell_row[i]] | cols[cell_col[i]] | boxes[cell_box[i]])
+                    if not mask:
+                        return False
+                    if not mask & (mask - 1):
+                        place(i, mask.bit_length())
+                        changed = True
+            for unit in self.units:
+                once = twice = placed = 0
+                for i in unit:
+                    if cells[i]:
+                        placed |= 1 << (cells[i] - 1)
+                    else:
+                        mask = all_digits & ~(rows[cell_row[i]] | cols[cell_col[i]] | boxes[cell_box[i]])
+                        twice |= once & mask
+                        once |= mask
+                if once | placed != all_digits:
+                    return False  # どこにも置けない数字がある
+                singles = once & ~twice & ~placed
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for i in unit:
+                        if cells[i] == 0 and self.candidates(i) & bit:
+                            place(i, bit.bit_length())
+                            changed = True
+                            break
+                    else:
+                        return False
+        return True
+
+    def pick_cell(self):
+        # 候補数が最も少ない空きセルを返す（すべて埋まっていれば -1）
+        best, best_mask, best_count = -1, 0, len(self.rows) + 1
+        cells, rows, cols, boxes = self.cells, self.rows, self.cols, self.boxes
+        cell_row, cell_col, cell_box = self.cell_row, self.cell_col, self.cell_box
+        all_digits = self.all_digits
+        for i in range(self.area):
+            if cells[i] == 0:
+                mask = all_digits & ~(rows[cell_row[i]] | cols[cell_col[i]] | boxes[cell_box[i]])
+                count = mask.bit_count()
+                if count < best_count:
+                    best, best_mask, best_count = i, mask, count
+                    if count <= 2:
+                        break
+        return best, best_mask
+
+    def search(self, limit=1):
+        # 見つけた解の数を返す。limit に達した場合は最後の解を盤面に残す
+        self.nodes += 1
+        mark = len(self.trail)
+        if not self.propagate():
+            self.undo(mark)
+            return 0
+        i, mask = self.pick_cell()
+        if i < 0:
+            return 1
+        nums = []
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            nums.append(bit.bit_length())
+        if self.rng is not None:
+            self.rng.shuffle(nums)  # 数字の順番をランダムにする
+        count = 0
+        for num in nums:
+            inner = len(self.trail)
+            self.place(i, num)
+            count += self.search(limit - count)
+            if count >= limit:
+                return count
+            self.undo(inner)
+        self.undo(mark)
+        return count
+
+    def clear(self, i):
+        # 初期配置の数字を消す（trail には積まない）
+        bit = ~(1 << (self.cells[i] - 1))
+        self.cells[i] = 0
+        self.rows[self.cell_row[i]] &= bit
+        self.cols[self.cell_col[i]] &= bit
+        self.boxes[self.cell_box[i]] &= bit
+
+    def restore(self, i, num):
+        bit = 1 << (num - 1)
+        self.cells[i] = num
+        self.rows[self.cell_row[i]] |= bit
+        self.cols[self.cell_col[i]] |= bit
+        self.boxes[self.cell_box[i]] |= bit
+
+    def has_other_solution(self, i, num):
+        # 空いたセル i に num 以外を入れた解があるか調べる。
+        # 消す前の盤面の解が一意なら、別解は必ずセル i の値が異なる
+        mask = self.candidates(i) & ~(1 << (num - 1))
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            mark = len(self.trail)
+            self.place(i, bit.bit_length())
+            found = self.search(1)
+            self.undo(mark)
+            if found:
+                return True
+        return False
+
+    def write_to(self, board):
+        board.cells[:] = bytes(self.cells)
 
 def is_valid(board, row, col, num):
-    for i in range(9):
-        if board[row][i] == num or board[i][col] == num:
-            return False
-    start_row, start_col = 3 * (row // 3), 3 * (col // 3)
-    for i in range(3):
-        for j in range(3):
-            if board[start_row + i][start_col + j] == num:
+    geo = geometry(board.box_size)
+    size = geo.size
+    units = geo.units
+    for unit in (units[row], units[size + col], units[2 * size + geo.cell_box[row * size + col]]):
+        for i in unit:
+            if board.cells[i] == num:
                 return False
     return True
 
-def solve(board):
-    empty = find_empty(board)
-    if not empty:
-        return True
-    row, col = empty
-    nums = list(range(1, 10))
-    random.shuffle(nums)  # 数字の順番をランダムにする
-    for num in nums:
-        if is_valid(board, row, col, num):
-            board[row][col] = num
-            if solve(board):
-                return True
-            board[row][col] = 0
-    return False
+SOLVER_BACKENDS = ("bitmask", "dlx")
+# 穴あけ（remove_numbers_to_target / remove_numbers_parallel）に使えるソルバー。
+# Dancing Links は被覆を後に入れたものから順にしか戻せず、手がかりを1つ外すたびに作り直すことになるので使わない
+REMOVAL_BACKENDS = ("bitmask",)
+_solvers = {}
+
+def get_solver(backend="bitmask", randomize=False, box=3):
+    # 名前で選んだソルバーを返す。探索状態は使い回すので、同じ組み合わせでは同じインスタンスになる
+    key = (backend, randomize, box)
+    if key not in _solvers:
+        rng = random if randomize else None  # randomize なら数字を試す順番をランダムにする
+        if backend == "bitmask":
+            _solvers[key] = BitmaskSolver(rng, box)
+        elif backend == "dlx":
+            from dlx_solver import DancingLinksSolver
+
+            _solvers[key] = DancingLinksSolver(rng, box)
+        else:
+            raise ValueError(f"unknown solver backend: {backend}")
+    return _solvers[key]
+
+def solve(board, backend="bitmask"):
+    solver = get_solver(backend, True, board.box_size)
+    if not solver.load(board) or not solver.search(1):
+        return False
+    solver.write_to(board)
+    return True
 
 def find_empty(board):
-    for i in range(9):
-        for j in range(9):
-            if board[i][j] == 0:
-                return (i, j)
-    return None
-
-def generate_full_sudoku():
-    board = [[0 for _ in range(9)] for _ in range(9)]
-    fill_diagonal_boxes(board)  # 対角線上のボックスにランダムな数字を配置
-    solve(board)
-    return board
+    # 候補が最も少ない空きセルを返す
+    solver = BitmaskSolver(box=board.box_size)
+    if not solver.load(board):
+        return None
+    i, _ = solver.pick_cell()
+    if i < 0:
+        return None
+    return divmod(i, board.size)
+
+def generate_full_sudoku(backend="bitmask", box=3):
+    while True:
+        board = Board(box=box)
+        fill_diagonal_boxes(board)  # 対角線上のボックスにランダムな数字を配置
+        if solve(board, backend):  # 4×4 では配置によって解がないことがある
+            return board
 
 def fill_diagonal_boxes(board):
-    for i in range(0, 9, 3):
+    for i in range(0, board.size, board.box_size):
         fill_box(board, i, i)
 
 def fill_box(board, row_start, col_start):
-    nums = list(range(1, 10))
+    nums = list(range(1, board.size + 1))
     random.shuffle(nums)
-    for i in range(3):
-        for j in range(3):
-            board[row_start + i][col_start + j] = nums.pop()
+    for i in range(board.box_size):
+        for j in range(board.box_size):
+            board[row_start + i, col_start + j] = nums.pop()
 
-def remove_numbers_from_board(board, attempts=5):
+def remove_numbers_from_board(board, attempts=5, target_clues=None, backend="bitmask"):
+    if target_clues is not None:
+        return remove_numbers_to_target(board, target_clues, backend)[0]
+    last = board.size - 1
     while attempts > 0:
-        row, col = random.randint(0, 8), random.randint(0, 8)
-        while board[row][col] == 0:
-            row, col = random.randint(0, 8), random.randint(0, 8)
-        backup = board[row][col]
-        board[row][col] = 0
-        board_copy = [row[:] for row in board]
-        if not has_unique_solution(board_copy):
-            board[row][col] = backup
+        row, col = random.randint(0, last), random.randint(0, last)
+        while board[row, col] == 0:
+            row, col = random.randint(0, last), random.randint(0, last)
+        backup = board[row, col]
+        board[row, col] = 0
+        if count_solutions(board, 2, backend) != 1:
+            board[row, col] = backup
             attempts -= 1
     return board
 
-def has_unique_solution(board):
-    solutions = []
+# ボックスの大きさごとの手がかりの数の既定値。16×16 は 100、25×25 は 300 を切るあたりから
+# 一意性の判定に数秒〜数分かかるようになるので、その手前までにしておく
+DEFAULT_CLUES = {2: (6, 8), 3: (22, 30), 4: (110, 130), 5: (320, 360)}
 
-    def solve_unique(board):
-        if len(solutions) > 1:
-            return
-        empty = find_empty(board)
-        if not empty:
-            solutions.append([row[:] for row in board])
+def remove_numbers_to_target(board, target_clues=None, backend="bitmask"):
+    # 手がかりの数が目標（整数か (最小, 最大) の範囲）になるまで、シャッフルした順にセルを消していく。
+    # 消すたびに探索状態を作り直さず、同じソルバーで別解の有無だけを調べる
+    start = time.perf_counter()
+    if target_clues is None:
+        target_clues = DEFAULT_CLUES[board.box_size]
+    if isinstance(target_clues, int):
+        target_clues = (target_clues, target_clues)
+    if backend not in REMOVAL_BACKENDS:
+        raise ValueError(f"solver backend {backend!r} cannot remove numbers; use one of {REMOVAL_BACKENDS}")
+    target = random.randint(*target_clues)
+    solver = get_solver(backend, False, board.box_size)
+    if not solver.load(board):
+        raise ValueError("board has conflicting numbers")
+    cells = board.cells
+    clues = len(cells) - cells.count(0)
+    checks = 0
+    order = list(range(len(cells)))
+    random.shuffle(order)
+    for i in order:
+        if clues <= target:
+            break
+        num = cells[i]
+        if not num:
+            continue
+        solver.clear(i)
+        checks += 1
+        if solver.has_other_solution(i, num):
+            solver.restore(i, num)
+        else:
+            cells[i] = 0
+            clues -= 1
+    stats = {"clues": clues, "checks": checks, "seconds": time.perf_counter() - start}
+    return board, stats
+
+SPECULATIVE_BATCH = 8  # 並列版で1度に調べるセルの数（結果はこの数とシードで決まり、プロセス数にはよらない）
+
+def check_removal(job):
+    # 並列版の穴あけでワーカーが実行する。空けたセル cell に num 以外が入る解があれば True
+    data, box, cell, num, backend = job
+    solver = get_solver(backend, False, box)
+    solver.load(Board(data, box))
+    return solver.has_other_solution(cell, num)
+
+def remove_numbers_parallel(board, pool, target_clues=None, batch=SPECULATIVE_BATCH, backend="bitmask"):
+    # remove_numbers_to_target の並列版。1回の判定がプロセス間のやり取りより短い大きさでは、1プロセスより遅くなる。
+    # シャッフルした順に batch 個のセルを、それぞれ今の盤面から消せるかプロセスプールで同時に調べ、
+    # 消せるものをまとめて消した盤面も一意ならすべて確定する。まとめると一意でなくなるときは最初の1つだけ確定し、
+    # 残りは次の回に調べ直す。消せなかったセルは、手がかりが減っても消せるようにはならないので調べ直さない
+    start = time.perf_counter()
+    if target_clues is None:
+        target_clues = DEFAULT_CLUES[board.box_size]
+    if isinstance(target_clues, int):
+        target_clues = (target_clues, target_clues)
+    if backend not in REMOVAL_BACKENDS:
+        raise ValueError(f"solver backend {backend!r} cannot remove numbers; use one of {REMOVAL_BACKENDS}")
+    target = random.randint(*target_clues)
+    if not get_solver(backend, False, board.box_size).load(board):
+        raise ValueError("board has conflicting numbers")
+    cells = board.cells
+    box = board.box_size
+    clues = len(cells) - cells.count(0)
+    checks = rounds = 0
+    order = list(range(len(cells)))
+    random.shuffle(order)  # remove_numbers_to_target と同じ順番になる
+    pending = collections.deque(i for i in order if cells[i])
+    while pending and clues > target:
+        picked = [pending.popleft() for _ in range(min(batch, clues - target, len(pending)))]
+        jobs = []
+        for i in picked:
+            data = bytearray(cells)
+            data[i] = 0
+            jobs.append((bytes(data), box, i, cells[i], backend))
+        results = pool.map(check_removal, jobs, chunksize=1)
+        checks += len(jobs)
+        rounds += 1
+        passed = [i for i, other in zip(picked, results) if not other]
+        if len(passed) > 1:
+            # 別解があれば、今回空けたどれかのセルの値が元の解と異なるので、そのセルだけを調べればよい
+            data = bytearray(cells)
+            for i in passed:
+                data[i] = 0
+            data = bytes(data)
+            results = pool.map(check_removal, [(data, box, i, cells[i], backend) for i in passed], chunksize=1)
+            checks += len(passed)
+            rounds += 1
+            if any(results):
+                pending.extendleft(reversed(passed[1:]))
+                passed = passed[:1]
+        for i in passed:
+            cells[i] = 0
+        clues -= len(passed)
+    stats = {"clues": clues, "checks": checks, "rounds": rounds, "seconds": time.perf_counter() - start}
+    return board, stats
+
+def count_solutions(board, limit=2, backend="bitmask"):
+    # limit 個見つかった時点で打ち切る。盤面はコピーもシャッフルもしない
+    solver = get_solver(backend, False, board.box_size)
+    if not solver.load(board):
+        return 0
+    return solver.search(limit)
+
+def has_unique_solution(board, backend="bitmask"):
+    return count_solutions(board, 2, backend) == 1
+
+# 数字の置き換え・バンド内の行の入れ替え・バンドの入れ替え（列も同様）・転置は、
+# 解の一意性を保ったまま問題を別の問題に変える（回転もこれらの組み合わせで表せる）
+
+def shuffled_lines(box=3):
+    # バンドの順番とバンド内の行の順番をランダムに並べ替えた行番号の列
+    bands = random.sample(range(box), box)
+    return [box * band + line for band in bands for line in random.sample(range(box), box)]
+
+def random_transform(box=3):
+    # 変換後のセル i に、元の盤面のどのセルを持ってくるかの表と、数字の置き換え表を返す
+    size = box * box
+    rows, cols = shuffled_lines(box), shuffled_lines(box)
+    if random.random() < 0.5:
+        cell_map = [cols[c] * size + rows[r] for r in range(size) for c in range(size)]
+    else:
+        cell_map = [rows[r] * size + cols[c] for r in range(size) for c in range(size)]
+    digit_map = bytes([0] + random.sample(range(1, size + 1), size)) + bytes(range(size + 1, 256))
+    return cell_map, digit_map
+
+def apply_transform(board, transform):
+    cell_map, digit_map = transform
+    cells = board.cells
+    new = Board.__new__(Board)
+    new.cells = bytearray([cells[i] for i in cell_map]).translate(digit_map)
+    new.box_size = board.box_size
+    return new
+
+def transform_puzzle(board, full_board):
+    # 問題と解答に同じ変換をかけ、一意性の探索なしで別の問題を作る
+    transform = random_transform(board.box_size)
+    return apply_transform(board, transform), apply_transform(full_board, transform)
+
+def line_orders():
+    # 9×9 の、バンドの順番 × バンド内の順番の 6 × 6 × 6 × 6 = 1296 通りの並べ替え
+    orders = []
+    for bands in itertools.permutations(range(BOX)):
+        for lines in itertools.product(itertools.permutations(range(BOX)), repeat=BOX):
+            orders.append(tuple(BOX * band + line for band, perm in zip(bands, lines) for line in perm))
+    return orders
+
+LINE_ORDERS = line_orders()
+
+def canonical_form(board):
+    # 同じ問題から変換で作れる盤面の中で、数字を出現順に 1, 2, 3... と付け直した文字列が最小のもの。
+    # 同値な問題は必ず同じ文字列になるので、問題集の重複除去に使える。
+    # 並べ替えを総当たりするので 9×9 のみ（16×16 では 24 の 5 乗 × 2 通りになる）
+    if board.box_size != BOX:
+        raise ValueError("canonical_form supports only 9x9 boards")
+    grid = [board.cells[r * SIZE : (r + 1) * SIZE] for r in range(SIZE)]
+    best = [None]
+    for lines in (grid, [bytes(col) for col in zip(*grid)]):
+        for order in LINE_ORDERS:
+            rows = [bytes(line[c] for c in order) for line in lines]
+            _min_rows(rows, [0] * (SIZE + 1), 1, [], -1, 0, 0, best)
+    return "".join(map(str, best[0]))
+
+def _min_rows(rows, mapping, next_label, out, band, used_rows, used_bands, best):
+    # 行をバンドの制約を守って並べ、数字を付け直した結果の最小値を best に入れる（best より大きい枝は打ち切る）
+    pos = len(out)
+    if pos == CELLS:
+        best[0] = out
+        return
+    row_in_band = (pos // SIZE) % BOX
+    if row_in_band:
+        candidates = [r for r in range(BOX * band, BOX * band + BOX) if not used_rows >> r & 1]
+    else:
+        candidates = [r for r in range(SIZE) if not used_bands >> (r // BOX) & 1]
+    results = []
+    for r in candidates:
+        labels = mapping[:]
+        label = next_label
+        line = []
+        for num in rows[r]:
+            if num and not labels[num]:
+                labels[num] = label
+                label += 1
+            line.append(labels[num])
+        results.append((line, r, labels, label))
+    least = min(result[0] for result in results)
+    if best[0] is not None:
+        bound = best[0][pos : pos + SIZE]
+        if least > bound:
             return
-        row, col = empty
-        nums = list(range(1, 10))
-        random.shuffle(nums)
-        for num in nums:
-            if is_valid(board, row, col, num):
-                board[row][col] = num
-                solve_unique(board)
-                board[row][col] = 0
+        if least < bound:
+            best[0] = None  # ここから先はどれを選んでも今の best より小さい
+    for line, r, labels, label in results:
+        if line == least:
+            next_band = band if row_in_band else r // BOX
+            _min_rows(rows, labels, label, out + line, next_band, used_rows | 1 << r, used_bands | 1 << next_band, best)
+
+def puzzle_signature(board):
+    # 変換しても変わらない簡単な特徴（数字ごとの個数と、バンド・スタックごとの行・列の手がかりの数）
+    cells = board.cells
+    box, size = board.box_size, board.size
+    row_counts = [size - cells[r * size : (r + 1) * size].count(0) for r in range(size)]
+    col_counts = [size - cells[c::size].count(0) for c in range(size)]
+    bands = tuple(sorted(tuple(sorted(row_counts[box * b : box * b + box])) for b in range(box)))
+    stacks = tuple(sorted(tuple(sorted(col_counts[box * b : box * b + box])) for b in range(box)))
+    digits = tuple(sorted(cells.count(num) for num in range(1, size + 1)))
+    return digits, min(bands, stacks), max(bands, stacks)
+
+def dedupe_puzzles(boards):
+    # 変換で互いに移り合う問題を1つにまとめる。特徴が同じ問題どうしだけ canonical_form で比べる
+    buckets = {}
+    for i, board in enumerate(boards):
+        buckets.setdefault(puzzle_signature(board), []).append(i)
+    keep = []
+    for indices in buckets.values():
+        if len(indices) == 1:
+            keep.extend(indices)
+            continue
+        seen = set()
+        for i in indices:
+            # canonical_form は 9×9 のみなので、それ以外は同じ盤面どうしだけをまとめる
+            form = canonical_form(boards[i]) if boards[i].box_size == BOX else boards[i].to_string()
+            if form not in seen:
+                seen.add(form)
+                keep.append(i)
+    return [boards[i] for i in sorted(keep)]
 
-    solve_unique([row[:] for row in board])
-    return len(solutions) == 1
+def parse_clue_range(text):
+    low, _, high = text.partition("-")
+    return (int(low), int(high or low))
 
 if __name__ == "__main__":
-    board = generate_full_sudoku()
-    board = remove_numbers_from_board(board)
-    if has_unique_solution(board):
-        print("Generated Sudoku with a unique solution:")
-        for row in board:
-            print(row)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="数独の問題を生成する")
+    parser.add_argument("--batch", type=int, metavar="COUNT", help="COUNT 個の問題をまとめて --out に書き出す")
+    parser.add_argument("--out", default="puzzles.sdk", help="書き出し先（途中で止まったファイルは続きから再開する）")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="プロセス数（省略時は CPU コア数。--batch なしで指定すると1問を並列に作る）"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="乱数のシード（同じシードなら同じ問題になる。--batch では省略時 0）"
+    )
+    parser.add_argument("--box", type=int, default=3, choices=(3, 4, 5), help="ボックスの大きさ（4 なら 16×16）")
+    parser.add_argument(
+        "--clues", type=parse_clue_range, default=None, help="手がかりの数（例: 22-30。省略時は盤面の大きさごとの既定値）"
+    )
+    parser.add_argument("--packed", action="store_true", help="1セル4ビットに詰めて書き出す（9×9 のみ）")
+    args = parser.parse_args()
+    if args.seed is not None and not 0 <= args.seed <= 0xFFFFFFFF:
+        parser.error("--seed must be between 0 and 4294967295")  # ヘッダーに符号なし32ビットで書くため
+
+    if args.batch:
+        from puzzle_bank import build_bank
+
+        try:
+            build_bank(args.out, args.batch, args.workers, args.seed or 0, args.clues, args.packed, args.box)
+        except ValueError as e:
+            parser.error(str(e))
     else:
-        print("Failed to generate a unique solution Sudoku. Try again.")
+        if args.seed is not None:
+            random.seed(args.seed)  # 並列でもワーカー数によらず、1プロセスと同じ問題になる
+        board = generate_full_sudoku(box=args.box)
+        if args.workers:
+            import multiprocessing
+
+            with multiprocessing.Pool(args.workers) as pool:
+                board, stats = remove_numbers_parallel(board, pool, args.clues)
+        else:
+            board, stats = remove_numbers_to_target(board, args.clues)
+        if has_unique_solution(board):
+            print("Generated Sudoku with a unique solution:")
+            print(board)
+            print(f"clues: {stats['clues']}, checks: {stats['checks']}, time: {stats['seconds'] * 1000:.2f} ms")
+        else:
+            print("Failed to generate a unique solution Sudoku. Try again.")
@@ -0,0 +1,258 @@
+import array
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+from make_suudoku import DEFAULT_CLUES, Board, generate_full_sudoku, remove_numbers_to_target
+
+# ファイル形式: 20バイトのヘッダーのあとに、問題と解答を固定長で並べる。
+# テキスト形式は1セル1バイト（'0' が空き、10 以上は 'A'〜）で 9×9 なら 81 + 81 バイト、
+# 圧縮形式は1セル4ビットで 41 + 41 バイト（数字が 15 までなので 9×9 のみ）
+HEADER = struct.Struct("<4sBBBxIIHH")  # マジック, バージョン, 圧縮, ボックスサイズ, チャンクサイズ, シード, 手がかりの数の範囲
+MAGIC = b"SDKB"
+VERSION = 2
+CHUNK_SIZE = 100  # 1ジョブで作る問題の数（再開はチャンク単位）
+
+
+def board_size(packed, box=3):
+    cells = box**4
+    return (cells + 1) // 2 if packed else cells
+
+
+def record_size(packed, box=3):
+    return 2 * board_size(packed, box)
+
+
+def encode_board(board, packed=False):
+    if not packed:
+        return board.to_bytes()
+    cells = board.cells + bytes(len(board.cells) % 2)
+    return bytes(cells[i] << 4 | cells[i + 1] for i in range(0, len(cells), 2))
+
+
+def decode_board(data, packed=False, box=3):
+    if not packed:
+        return Board.from_bytes(data)
+    board = Board(box=box)
+    cells = board.cells
+    count = len(cells)
+    for i, byte in enumerate(data[: count // 2]):
+        cells[2 * i] = byte >> 4
+        cells[2 * i + 1] = byte & 15
+    if count % 2:
+        cells[-1] = data[-1] >> 4
+    return board
+
+
+def encode_record(board, full_board, packed=False):
+    return encode_board(board, packed) + encode_board(full_board, packed)
+
+
+def decode_record(data, packed=False, box=3):
+    size = board_size(packed, box)
+    return decode_board(data[:size], packed, box), decode_board(data[size:], packed, box)
+
+
+def read_header(f):
+    magic, version, packed, box, chunk_size, seed, low, high = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("not a puzzle bank file")
+    if version != VERSION:
+        raise ValueError(f"puzzle bank format version {version} is not supported; build it again")
+    return bool(packed), box, chunk_size, seed, (low, high)
+
+
+def generate_chunk(job):
+    # チャンク番号ごとに乱数を固定するので、ワーカー数や再開の有無によらず同じ問題になる
+    seed, chunk, count, target_clues, packed, box = job
+    random.seed(f"{seed}:{chunk}")
+    data = bytearray()
+    for _ in range(count):
+        full_board = generate_full_sudoku(box=box)
+        board, _ = remove_numbers_to_target(full_board.copy(), target_clues)
+        data += encode_record(board, full_board, packed)
+    return data
+
+
+def build_bank(path, count, workers=None, seed=0, target_clues=None, packed=False, box=3):
+    if packed and box > 3:
+        raise ValueError("--packed supports only 9x9 boards (digits above 15 do not fit in 4 bits)")
+    if not 0 <= seed <= 0xFFFFFFFF:
+        raise ValueError("--seed must be between 0 and 4294967295")
+    # 省略時の既定値もヘッダーに書けるよう、手がかりの数は (最小, 最大) にそろえる
+    if target_clues is None:
+        target_clues = DEFAULT_CLUES[box]
+    if isinstance(target_clues, int):
+        target_clues = (target_clues, target_clues)
+    target_clues = tuple(target_clues)
+    size = record_size(packed, box)
+    done = 0
+    if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+        # 途中まで書かれたファイルは、最後に書き終わったチャンクの続きから再開する
+        with open(path, "rb") as f:
+            header = read_header(f)
+        if header != (packed, box, CHUNK_SIZE, seed, target_clues):
+            raise ValueError(
+                f"{path} was built with different settings; remove it or use the same --seed/--clues/--packed/--box"
+            )
+        done = (os.path.getsize(path) - HEADER.size) // size
+        if done >= count:
+            # もう十分な数があれば、チャンクの途中で終わっていても切り詰めずにそのまま使う
+            print(f"{path} already has {done} puzzles", file=sys.stderr)
+            return done
+        done -= done % CHUNK_SIZE
+        with open(path, "r+b") as f:
+            f.truncate(HEADER.size + done * size)
+    else:
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, packed, box, CHUNK_SIZE, seed, *target_clues))
+
+    jobs = [
+        (seed, chunk, min(CHUNK_SIZE, count - chunk * CHUNK_SIZE), target_clues, packed, box)
+        for chunk in range(done // CHUNK_SIZE, (count + CHUNK_SIZE - 1) // CHUNK_SIZE)
+    ]
+    start = time.perf_counter()
+    made = 0
+    with multiprocessing.Pool(workers) as pool, open(path, "ab") as f:
+        for data in pool.imap(generate_chunk, jobs):  # imap なのでチャンクの順番は保たれる
+            f.write(data)
+            f.flush()
+            made += len(data) // size
+            rate = made / (time.perf_counter() - start)
+            print(f"\r{done + made}/{count} puzzles ({rate:.0f} puzzles/s)", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    write_index(path, "clues")  # 難易度の索引は採点に時間がかかるので、python difficulty.py で別に作る
+    return done + made
+
+
+NONZERO_NIBBLES = [(byte >> 4 != 0) + (byte & 15 != 0) for byte in range(256)]
+
+
+def count_clues(data, packed=False):
+    if packed:
+        return sum(NONZERO_NIBBLES[byte] for byte in data)
+    return len(data) - data.count(b"0")
+
+def rate_level(data, packed=False):
+    from difficulty import rate
+
+    return rate(decode_board(data, packed))[0]
+
+
+# 索引の種類ごとに、問題データ（バイト列）から分類キーを求める関数
+INDEX_KEYS = {
+    "clues": count_clues,
+    "level": rate_level,  # difficulty.LEVEL_NAMES の番号
+}
+
+
+def index_path(path, key):
+    return f"{path}.{key}.idx"
+
+
+def bank_stamp(f):
+    # 索引がどの問題集から作られたかを見分けるための (ファイルサイズ, 更新時刻)
+    stat = os.fstat(f.fileno())
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_index(path, key="clues"):
+    # 問題番号をキーごとにまとめて並べた uint32 の配列と、各キーの (開始位置, 個数) を保存する。
+    # 先頭行の JSON のあとに配列が続く
+    key_func = INDEX_KEYS[key]
+    groups = {}
+    with open(path, "rb") as f:
+        stamp = bank_stamp(f)
+        packed, box = read_header(f)[:2]
+        size = record_size(packed, box)
+        puzzle_size = board_size(packed, box)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            count = (len(data) - HEADER.size) // size
+            for i in range(count):
+                offset = HEADER.size + i * size
+                value = key_func(data[offset : offset + puzzle_size], packed)
+                groups.setdefault(value, array.array("I")).append(i)
+    tiers = {}
+    order = array.array("I")
+    for value in sorted(groups):
+        tiers[value] = (len(order), len(groups[value]))
+        order.extend(groups[value])
+    header = json.dumps({"count": count, "bank": stamp, "tiers": tiers}).encode()
+    header += b" " * (-(len(header) + 1) % order.itemsize) + b"\n"  # 配列の先頭を4バイト境界に揃える
+    with open(index_path(path, key), "wb") as f:
+        f.write(header)
+        order.tofile(f)
+
+
+class PuzzleBank:
+    # 問題集ファイルを mmap で開き、索引から指定した範囲の問題を1件だけ読み出す。
+    # rebuild が False なら、索引がないか古いときに作り直さず ValueError にする（採点に時間がかかる "level" 用）
+    def __init__(self, path, key="clues", rebuild=True):
+        self.path = path
+        self.file = open(path, "rb")
+        self.packed, self.box = read_header(self.file)[:2]
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.record_size = record_size(self.packed, self.box)
+        self.count = (len(self.data) - HEADER.size) // self.record_size
+        try:
+            self.load_index(key, rebuild)
+        except ValueError:
+            self.data.close()
+            self.file.close()
+            raise
+
+    def load_index(self, key, rebuild=True):
+        path = index_path(self.path, key)
+        if not os.path.exists(path) or self.read_index_header(path).get("bank") != bank_stamp(self.file):
+            # 索引がないか、別の問題集や追記・作り直し前の問題集から作られていれば作り直す
+            if not rebuild:
+                raise ValueError(f"{path} is missing or does not match {self.path}")
+            write_index(self.path, key)
+        header = self.read_index_header(path)
+        self.tiers = {int(value): tier for value, tier in header["tiers"].items()}
+        self.index_file = open(path, "rb")
+        self.index_data = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.order = memoryview(self.index_data)[header["size"] :].cast("I")
+
+    @staticmethod
+    def read_index_header(path):
+        with open(path, "rb") as f:
+            line = f.readline()
+        header = json.loads(line)
+        header["size"] = len(line)
+        return header
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        offset = HEADER.size + i * self.record_size
+        return decode_record(self.data[offset : offset + self.record_size], self.packed, self.box)
+
+    def random_puzzle(self, low=None, high=None):
+        # キー（手がかりの数など）が low 以上 high 以下の問題から1つ選ぶ
+        tiers = [
+            tier
+            for value, tier in self.tiers.items()
+            if (low is None or value >= low) and (high is None or value <= high)
+        ]
+        total = sum(length for _, length in tiers)
+        if not total:
+            raise LookupError(f"no puzzle between {low} and {high} in {self.path}")
+        pick = random.randrange(total)
+        for start, length in tiers:
+            if pick < length:
+                return self[self.order[start + pick]]
+            pick -= length
+
+    def close(self):
+        self.order.release()
+        self.index_data.close()
+        self.index_file.close()
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,67 @@
+import multiprocessing
+import queue
+import random
+
+from make_suudoku import (
+    DEFAULT_CLUES,
+    generate_full_sudoku,
+    remove_numbers_from_board,
+    remove_numbers_parallel,
+    transform_puzzle,
+)
+
+
+def make_puzzle(target_clues=None, box=3, pool=None):
+    full_board = generate_full_sudoku(box=box)
+    if target_clues is None and box != 3:
+        target_clues = DEFAULT_CLUES[box]  # 16×16 以上は目標の数まで消す方式でないと手がかりが多すぎる
+    if pool is not None:
+        board, _ = remove_numbers_parallel(full_board.copy(), pool, target_clues)
+    else:
+        board = remove_numbers_from_board(full_board.copy(), target_clues=target_clues)
+    return board, full_board
+
+
+def fill_pool(puzzles, target_clues, box=3):
+    random.seed()  # fork で親と同じ乱数列にならないように初期化し直す
+    while True:
+        puzzles.put(make_puzzle(target_clues, box))  # キューが満杯の間はここで待機する
+
+
+class PuzzlePool:
+    # 別プロセスで常に size 個の問題（と解答）を作り置きしておく
+    def __init__(self, size=5, target_clues=None, box=3, first_workers=None):
+        self.target_clues = target_clues
+        self.box = box
+        self.first_workers = first_workers  # 2 以上なら、最初の1問を複数プロセスで並列に作る
+        self.last = None  # 最後に取り出した問題（作り置きが尽きたときの変換元）
+        self.puzzles = multiprocessing.Queue(maxsize=size)
+        self.worker = multiprocessing.Process(target=fill_pool, args=(self.puzzles, target_clues, box), daemon=True)
+        self.worker.start()
+
+    def pop(self):
+        try:
+            board, full_board = self.puzzles.get_nowait()
+        except queue.Empty:
+            if self.last:
+                return transform_puzzle(*self.last)  # 作り置きが尽きたら、前の問題を変換して別の見た目にする
+            board, full_board = self.make_first_puzzle()  # 最初の1問だけはその場で生成する
+        # 渡した盤面はゲーム中に埋められていくので、変換元には別のコピーを残しておく
+        self.last = (board.copy(), full_board.copy())
+        return board, full_board
+
+    def make_first_puzzle(self):
+        if not self.first_workers or self.first_workers < 2:
+            return make_puzzle(self.target_clues, self.box)
+        pool = multiprocessing.Pool(self.first_workers)
+        try:
+            return make_puzzle(self.target_clues, self.box, pool)
+        finally:
+            # terminate ではなく close で終わらせる（pygame の初期化後に起動したプロセスは SIGTERM で止まらない）
+            pool.close()
+            pool.join()
+
+    def close(self):
+        self.worker.terminate()
+        self.worker.join()
+        self.puzzles.close()
@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+
+from benchmark import HARD_PUZZLES
+from make_suudoku import (
+    SOLVER_BACKENDS,
+    SPECULATIVE_BATCH,
+    Board,
+    count_solutions,
+    generate_full_sudoku,
+    remove_numbers_parallel,
+    remove_numbers_to_target,
+)
+from puzzle_bank import HEADER, build_bank, decode_record, encode_record, record_size
+
+# ソルバーや問題集の形式を変えたときに、結果が変わっていないかを確かめる。
+# python regression_check.py で全項目を調べ、食い違いがあれば終了コード 1
+
+
+def with_one_clue_removed(board):
+    # board と、その手がかりを1つずつ消した問題（たいてい解が複数になる）
+    boards = [board]
+    for i, num in enumerate(board.cells):
+        if num:
+            removed = board.copy()
+            removed.cells[i] = 0
+            boards.append(removed)
+    return boards
+
+
+def compare_backends(boards, limit):
+    failures = []
+    for puzzle in boards:
+        counts = {backend: count_solutions(puzzle, limit, backend) for backend in SOLVER_BACKENDS}
+        if len(set(counts.values())) != 1:
+            failures.append(f"count_solutions differs on {puzzle.to_string()}: {counts}")
+    return failures
+
+
+def check_backends(limit=10):
+    # 難問とその手がかりを1つずつ消した問題で、各ソルバーの解の数が一致するか
+    failures = []
+    for text in HARD_PUZZLES:
+        board = Board.from_string(text)
+        failures += compare_backends(with_one_clue_removed(board), limit)
+        if count_solutions(board, 2) != 1:
+            failures.append(f"{text} should have exactly one solution")
+    return failures
+
+
+def check_sizes(seed=0, count=3, limit=10):
+    # 4×4・9×9・16×16 の生成した問題でも、各ソルバーの解の数が一致するか（16×16 は消すセルを一部に絞る）
+    random.seed(seed)
+    failures = []
+    for box in (2, 3, 4):
+        for _ in range(count):
+            board = remove_numbers_to_target(generate_full_sudoku(box=box))[0]
+            boards = with_one_clue_removed(board)
+            failures += compare_backends(boards if box < 4 else boards[:20], limit)
+    return failures
+
+
+def check_records(seed=0, count=20):
+    # encode_record と decode_record で、問題と解答がそのまま戻るか（圧縮形式は 9×9 のみ）
+    random.seed(seed)
+    failures = []
+    for box, packed in ((2, False), (3, False), (3, True), (4, False)):
+        for _ in range(count):
+            full_board = generate_full_sudoku(box=box)
+            board = remove_numbers_to_target(full_board.copy())[0]
+            data = encode_record(board, full_board, packed)
+            if len(data) != record_size(packed, box):
+                failures.append(f"box {box} packed={packed}: record is {len(data)} bytes")
+            decoded = decode_record(data, packed, box)
+            if [b.cells for b in decoded] != [board.cells, full_board.cells]:
+                failures.append(f"box {box} packed={packed}: {board.to_string()} did not round-trip")
+    return failures
+
+
+def check_resume(seed=1, count=150):
+    # 途中で止めた問題集を再開しても、一度に作ったものとバイト単位で同じになるか。
+    # 作り終わったファイルに少ない数で再実行しても、切り詰めたり作り直したりしないか
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for packed in (False, True):
+            whole = os.path.join(tmp, f"whole{packed:d}.sdk")
+            resumed = os.path.join(tmp, f"resumed{packed:d}.sdk")
+            build_bank(whole, count, 2, seed, packed=packed)
+            with open(whole, "rb") as f:
+                expected = f.read()
+            build_bank(resumed, count - 100, 2, seed, packed=packed)  # 最後のチャンクが途中で終わるファイル
+            with open(resumed, "r+b") as f:
+                f.truncate(HEADER.size + 30 * record_size(packed) + 5)  # 書きかけのレコードで止まったことにする
+            build_bank(resumed, count, 2, seed, packed=packed)
+            build_bank(resumed, count - 100, 2, seed, packed=packed)
+            with open(resumed, "rb") as f:
+                if f.read() != expected:
+                    failures.append(f"packed={packed}: resumed bank differs from a bank built in one run")
+    return failures
+
+
+def make_parallel(seed, box, workers, batch):
+    random.seed(seed)
+    full_board = generate_full_sudoku(box=box)
+    with multiprocessing.Pool(workers) as pool:
+        return remove_numbers_parallel(full_board, pool, batch=batch)[0]
+
+
+def make_serial(seed, box):
+    random.seed(seed)
+    return remove_numbers_to_target(generate_full_sudoku(box=box))[0]
+
+
+def check_parallel(seeds=(0, 1, 2)):
+    # remove_numbers_parallel は同じシードならワーカー数によらず同じ問題になり、
+    # batch=1 なら remove_numbers_to_target と同じ問題になるか
+    failures = []
+    for box in (2, 3):
+        for seed in seeds:
+            boards = {workers: make_parallel(seed, box, workers, SPECULATIVE_BATCH).to_string() for workers in (2, 3)}
+            if len(set(boards.values())) != 1:
+                failures.append(f"box {box} seed {seed}: different puzzles per worker count {boards}")
+            if make_parallel(seed, box, 2, 1).cells != make_serial(seed, box).cells:
+                failures.append(f"box {box} seed {seed}: batch=1 differs from remove_numbers_to_target")
+    return failures
+
+
+CHECKS = {
+    "backends": check_backends,
+    "sizes": check_sizes,
+    "records": check_records,
+    "resume": check_resume,
+    "parallel": check_parallel,
+}
+
+
+if __name__ == "__main__":
+    failed = False
+    for name, check in CHECKS.items():
+        failures = check()
+        print(f"{name}: {'ok' if not failures else f'{len(failures)} failures'}")
+        for line in failures[:20]:
+            print(f"  {line}")
+        failed = failed or bool(failures)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,348 @@
+import bisect
+import collections
+import time
+
+import pygame
+
+
+class GlyphCache:
+    # font.render の結果を (フォント, 文字列, 色) ごとに覚えておき、毎フレームの描画を blit だけにする。
+    # 上限を超えたら、最も長く使われていないものから捨てる
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.surfaces = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"glyph cache: {len(self)} surfaces, {self.hits} hits, {self.misses} misses ({rate:.1%} hit rate)"
+
+
+class LayerCache:
+    # 背景のようにめったに変わらない Surface を、key（ウィンドウや盤面の大きさ）が変わったときだけ作り直す
+    def __init__(self, build):
+        self.build = build
+        self.key = None
+        self.surface = None
+        self.builds = 0
+
+    def get(self, key):
+        if self.surface is None or key != self.key:
+            self.surface = self.build()
+            self.key = key
+            self.builds += 1
+        return self.surface
+
+    def stats(self):
+        return f"board layer: built {self.builds} times"
+
+
+class DirtyRects:
+    # 描き換えた矩形を集めておき、フレームの最後に pygame.display.update でその範囲だけを画面に送る。
+    # 全体を描き直したときは add_all() で flip にする
+    def __init__(self):
+        self.rects = []
+        self.full = False
+        self.updates = 0
+        self.pixels = 0
+
+    def add(self, rect):
+        if not self.full:
+            self.rects.append(pygame.Rect(rect))
+
+    def add_all(self):
+        self.full = True
+        self.rects = []
+
+    def present(self):
+        if self.full:
+            pygame.display.flip()
+            width, height = pygame.display.get_surface().get_size()
+            self.pixels += width * height
+        elif self.rects:
+            pygame.display.update(self.rects)
+            self.pixels += sum(rect.width * rect.height for rect in self.rects)
+        else:
+            return
+        self.updates += 1
+        self.rects = []
+        self.full = False
+
+    def stats(self):
+        per_update = self.pixels / self.updates if self.updates else 0
+        return f"screen updates: {self.updates} presents, {per_update:.0f} pixels sent per present on average"
+
+
+class Animator:
+    # 再生中のエフェクトを1つの時計で進める。エフェクトは duration（秒）と draw(t) を持ち、
+    # draw は開始から t 秒後の姿を描いて、描いた矩形のリストを返す。
+    # 毎フレーム、前のフレームで描いた範囲を erase で元に戻してから全部を描き直すので、エフェクトは重なってもよい
+    def __init__(self, erase, dirty, clock=time.perf_counter):
+        self.erase = erase
+        self.dirty = dirty
+        self.clock = clock
+        self.effects = []  # (開始時刻, エフェクト, 終わったときに呼ぶ関数)
+        self.drawn = []
+
+    def start(self, effect, delay=0.0, on_done=None):
+        # delay 秒後に再生を始める。このエフェクトが終わるまでの秒数を返す
+        self.effects.append((self.clock() + delay, effect, on_done))
+        return delay + effect.duration
+
+    def update(self, now=None):
+        if now is None:
+            now = self.clock()
+        for rect in self.drawn:
+            self.erase(rect)
+        self.drawn = []
+        running = []
+        finished = []
+        for entry in self.effects:
+            start, effect, on_done = entry
+            if now - start >= effect.duration:
+                if on_done is not None:
+                    finished.append(on_done)
+                continue
+            running.append(entry)
+            if now >= start:
+                self.drawn += effect.draw(now - start)
+        self.effects = running
+        for rect in self.drawn:
+            self.dirty.add(rect)
+        for on_done in finished:
+            on_done()
+
+    def clear(self):
+        self.effects = []
+
+    def __len__(self):
+        return len(self.effects)
+
+
+class RotationFrames:
+    # 画像を step 度ごとに回転させた Surface を、使った角度から順に作って覚えておく（1周で 360 / step 枚）
+    def __init__(self, image, step=5):
+        self.image = image
+        self.step = step
+        self.frames = {}
+
+    def get(self, angle):
+        angle = angle // self.step * self.step % 360
+        frame = self.frames.get(angle)
+        if frame is None:
+            frame = self.frames[angle] = pygame.transform.rotate(self.image, angle)
+        return frame
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class FrameStats:
+    # 直近 window フレームの処理時間を段階（update / draw / present など）ごとに記録し、分布を出す
+    buckets_ms = (1, 2, 4, 8, 16, 33, 50, 100)
+
+    def __init__(self, window=600):
+        self.window = window
+        self.times = {}  # 段階の名前 -> 直近の処理時間（秒）
+        self.last = None
+
+    def begin(self):
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        # 前の begin / mark からの時間を phase の時間として記録する
+        now = time.perf_counter()
+        self.add(phase, now - self.last)
+        self.last = now
+
+    def add(self, phase, seconds):
+        if phase not in self.times:
+            self.times[phase] = collections.deque(maxlen=self.window)
+        self.times[phase].append(seconds)
+
+    def histogram(self, phase):
+        # buckets_ms の各境界以下に入ったフレーム数（最後は上限を超えたもの）
+        counts = [0] * (len(self.buckets_ms) + 1)
+        for seconds in self.times.get(phase, ()):
+            counts[bisect.bisect_left(self.buckets_ms, seconds * 1000)] += 1
+        return counts
+
+    def summary(self):
+        lines = []
+        for phase, times in self.times.items():
+            ordered = sorted(times)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p95 = ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)] * 1000
+            counts = self.histogram(phase)
+            bins = " ".join(f"<={limit}:{count}" for limit, count in zip(self.buckets_ms, counts))
+            lines.append(
+                f"{phase:<8} p50 {p50:6.2f} ms  p95 {p95:6.2f} ms  max {ordered[-1] * 1000:7.2f} ms  "
+                f"[{bins} >{self.buckets_ms[-1]}:{counts[-1]}]"
+            )
+        return "\n".join(lines)
+
+
+_rings = {}
+
+
+def manhattan_rings(size, row, col):
+    # (row, col) から見て、マンハッタン距離が 1, 2, ... のセルの一覧。起点ごとに1回だけ作って覚えておく
+    key = (size, row, col)
+    if key not in _rings:
+        rings = [[] for _ in range(2 * size - 2)]
+        for r in range(size):
+            for c in range(size):
+                distance = abs(r - row) + abs(c - col)
+                if distance:
+                    rings[distance - 1].append((r, c))
+        _rings[key] = tuple(tuple(ring) for ring in rings)
+    return _rings[key]
+
+
+def color_ramp(start, end, steps):
+    # start から end へ近づく steps 段の色。ramp[k] は end の割合が 1 - k / (steps - 1) の色
+    ramp = []
+    for k in range(steps):
+        intensity = 1 - k / (steps - 1)
+        ramp.append(tuple(int(a * (1 - intensity) + b * intensity) for a, b in zip(start, end)))
+    return ramp
+
+
+# アニメーションのエフェクト。main.py と hand.py の Animator に渡す。
+# draw(t) は開始から t 秒後の絵を screen に描き、描いた矩形の一覧を返す
+
+
+class Bounce:
+    # 正解した数字を最初10倍にし、弾ませながら徐々に1倍に近づける
+    total_frames = 20  # フレーム数を増やしてスピードをゆっくりにする
+
+    def __init__(self, screen, rect, text, duration):
+        self.screen = screen
+        self.center = rect.center
+        self.text = text
+        self.duration = duration
+
+    def draw(self, t):
+        total_frames = self.total_frames
+        i = int(t / self.duration * total_frames)
+        offset = (total_frames - i) if i < total_frames / 2 else (i - total_frames / 2)
+        scale = 10 - 9 * (i / total_frames)
+        x, y = self.center
+        width, height = self.text.get_size()
+        text = pygame.transform.scale(self.text, (int(width * scale), int(height * scale)))
+        text_rect = text.get_rect(center=(x, y - offset))
+        self.screen.blit(text, text_rect)
+        return [text_rect]
+
+
+class Blink:
+    # セルの枠を color で3回点滅させる
+    interval = 0.1
+    duration = 6 * interval
+
+    def __init__(self, screen, rect, color):
+        self.screen = screen
+        self.rect = rect
+        self.color = color
+
+    def draw(self, t):
+        if int(t / self.interval) % 2:
+            return []
+        pygame.draw.rect(self.screen, self.color, self.rect, 3)
+        return [self.rect]
+
+
+class Shake:
+    # 不正解の値を左右に揺らす
+    offsets = [-5, 5, -3, 3, -1, 1, 0] * 2
+
+    def __init__(self, screen, rect, text, interval):
+        self.screen = screen
+        self.center = rect.center
+        self.text = text
+        self.interval = interval
+        self.duration = len(self.offsets) * interval
+
+    def draw(self, t):
+        x, y = self.center
+        dx = self.offsets[min(len(self.offsets) - 1, int(t / self.interval))]
+        text_rect = self.text.get_rect(center=(x + dx, y))
+        self.screen.blit(self.text, text_rect)
+        return [text_rect]
+
+
+class Wave:
+    # 起点のセルから、マンハッタン距離の近い順にセルを色付けしていく。
+    # 距離ごとのセルと色は表にしてあるので、1フレームで描くのはその距離の輪だけ。
+    # cell_rect(row, col) はセルの矩形、number_at(row, col) はその時点の盤面の数字（0 は空き）
+    interval = 0.1  # 各距離ごとの時間（秒）
+
+    def __init__(self, screen, rings, colors, cell_rect, number_at, font, color):
+        self.screen = screen
+        self.rings = rings
+        self.colors = colors
+        self.cell_rect = cell_rect
+        self.number_at = number_at
+        self.font = font
+        self.color = color
+        self.duration = len(colors) * self.interval
+
+    def draw(self, t):
+        distance = int(t / self.interval) + 1
+        if distance > len(self.rings):
+            return []
+        wave_color = self.colors[distance - 1]
+        rects = []
+        for row, col in self.rings[distance - 1]:
+            rect = self.cell_rect(row, col)
+            pygame.draw.rect(self.screen, wave_color, rect)
+            num = self.number_at(row, col)
+            if num != 0:  # 数字がある場合のみ表示
+                text = glyphs.render(self.font, str(num), self.color)
+                self.screen.blit(text, text.get_rect(center=rect.center))
+            rects.append(rect)
+        return rects
+
+
+class Completion:
+    # クリアの文字と、キャラクターを frames の刻みで回転させる
+    interval = 0.03
+    last_angle = 1800
+
+    def __init__(self, screen, frames, text, text_center, center):
+        self.screen = screen
+        self.frames = frames
+        self.text = text
+        self.text_rect = text.get_rect(center=text_center)
+        self.center = center
+        self.duration = (self.last_angle // frames.step + 1) * self.interval + 0.5  # 回り終わったあと 0.5 秒止める
+
+    def draw(self, t):
+        angle = min(self.last_angle, self.frames.step * int(t / self.interval))
+        rotated_image = self.frames.get(angle)
+        rotated_rect = rotated_image.get_rect(center=self.center)
+        self.screen.blit(self.text, self.text_rect)
+        self.screen.blit(rotated_image, rotated_rect.topleft)
+        return [self.text_rect, rotated_rect]
+
+
+glyphs = GlyphCache()  # main.py と hand.py で共有する
@@ -0,0 +1,137 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import hand as game
+from benchmark import find_regressions, percentile, print_results
+from make_suudoku import generate_full_sudoku, remove_numbers_to_target
+
+# 盤面の描画とアニメーションを、ウィンドウを開かずに（SDL のダミードライバーで）計測する。
+# アニメーションの時計は1フレームごとに 1 / fps 秒ずつ進めるだけで、実際には待たない
+
+
+def setup(seed):
+    game.debug = 1  # 問題集やプロセスプールを使わない
+    game.setup(headless=True)
+    random.seed(seed)
+    game.full_board = generate_full_sudoku(box=game.BOX_SIZE)
+    game.board = remove_numbers_to_target(game.full_board.copy())[0]
+
+
+def summarize(times, effect_times=None):
+    times = sorted(times)
+    total = sum(times)
+    result = {
+        "runs": len(times),
+        "p50_ms": percentile(times, 50) * 1000,
+        "p95_ms": percentile(times, 95) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "mean_ms": total / len(times) * 1000,
+        "per_second": len(times) / total if total else 0.0,  # フレーム毎秒
+    }
+    if effect_times:
+        result["effect_ms"] = sum(effect_times) / len(effect_times) * 1000  # エフェクト1回分の描画時間の合計
+    return result
+
+
+def redraw():
+    game.draw_board(game.board)
+    game.display_comments()
+    game.dirty.present()
+
+
+def play(start, repeat, fps):
+    # start() で始めたエフェクトが終わるまでのフレームを描き、1フレームごとの時間を測る
+    clock = [0.0]
+    game.animator.clock = lambda: clock[0]
+    times = []
+    effect_times = []
+    for _ in range(repeat):
+        game.animator.clear()
+        redraw()
+        begin = time.perf_counter()
+        start()
+        while len(game.animator):
+            frame_start = time.perf_counter()
+            game.animator.update()
+            game.dirty.present()
+            times.append(time.perf_counter() - frame_start)
+            clock[0] += 1 / fps
+        effect_times.append(time.perf_counter() - begin)
+    return summarize(times, effect_times)
+
+
+def make_cases():
+    board, full_board = game.board, game.full_board
+    empty = next((i, j) for i in range(game.SIZE) for j in range(game.SIZE) if board[i, j] == 0)
+    filled = next((i, j) for i in range(game.SIZE) for j in range(game.SIZE) if board[i, j] != 0)
+    correct = full_board[empty]
+    wrong = correct % game.SIZE + 1
+    return [
+        ("correct_input", lambda: game.animate_correct_input(*empty, correct)),
+        ("cell_already_filled", lambda: game.animate_cell_already_filled(*filled)),
+        ("incorrect_input", lambda: game.animate_incorrect_input(*empty, wrong)),
+        ("completion", game.animate_completion),
+    ]
+
+
+def run_benchmarks(seed=0, repeat=5, fps=60, only=None):
+    setup(seed)
+    results = {}
+    if not only or "draw_board" in only:
+        times = []
+        for _ in range(repeat * 100):
+            start = time.perf_counter()
+            redraw()
+            times.append(time.perf_counter() - start)
+        results["draw_board"] = summarize(times)
+    for name, start in make_cases():
+        if only and name not in only:
+            continue
+        results[name] = play(start, repeat, fps)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="盤面の描画とアニメーションのベンチマーク（ウィンドウを開かない）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="各アニメーションを再生する回数")
+    parser.add_argument("--fps", type=int, default=60, help="アニメーションの時計を進める間隔（1 / fps 秒）")
+    parser.add_argument("--only", nargs="*", help="実行する項目の名前（draw_board や completion）")
+    parser.add_argument("--out", help="結果を JSON で保存するファイル")
+    parser.add_argument("--baseline", help="比較対象の JSON（遅くなった項目があれば終了コード 1）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する遅れの割合")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.seed, args.repeat, args.fps, args.only)
+    print_results(results)
+    for name, result in results.items():
+        if "effect_ms" in result:
+            print(f"{name}: {result['runs'] // args.repeat} frames, {result['effect_ms']:.1f} ms per effect")
+    print(game.glyphs.stats())
+    print(game.board_layer.stats())
+    print(game.dirty.stats())
+
+    if args.out:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "fps": args.fps,
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)